@@ -1,73 +1,365 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+import time
+import pandas as pd
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, wait
 import const as c
+import price_history
+
+# 価格取得全体の締め切り（秒）。これを過ぎても返ってこないプロバイダーの結果は使わない
+PRICE_FETCH_DEADLINE_SEC = 6
+
+# バックグラウンドで価格の期限切れを確認する間隔（秒）。実際に取り直すかはプロバイダーごとの ttl で決まる
+PRICE_REFRESH_INTERVAL_SEC = 60
+
+# ==========================================
+# ★ 外部APIへの接続（プロセス全体で1つのセッションを共有し、接続を使い回す）
+# ==========================================
+# 1リクエストのタイムアウト（秒）: (接続, 読み込み)
+HTTP_TIMEOUT_SEC = (3, 5)
+# 1ホストあたりの同時接続数の上限
+HTTP_MAX_CONNECTIONS_PER_HOST = 4
+# 一時的なエラー（接続失敗・429・5xx）のときのリトライ回数と待ち時間の係数（0.3秒, 0.6秒, ...）
+HTTP_RETRIES = 2
+HTTP_BACKOFF_FACTOR = 0.3
+
+@st.cache_resource
+def get_http_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST,
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def http_get(url, **kwargs):
+    """共有セッションで GET する（keep-alive で接続を使い回す）"""
+    kwargs.setdefault('timeout', HTTP_TIMEOUT_SEC)
+    return get_http_session().get(url, **kwargs)
+
+def get_http_stats():
+    """
+    ホストごとの接続の使い回し状況を返す（監視用）。
+    {ホスト: {'connections': 新しく張った接続の数, 'requests': 送ったリクエストの数}}
+    """
+    stats = {}
+    pools = get_http_session().get_adapter('https://').poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = stats.setdefault(pool.host, {'connections': 0, 'requests': 0})
+        host['connections'] += pool.num_connections
+        host['requests'] += pool.num_requests
+    return stats
 
 @st.cache_data(ttl=3600)
 def get_usd_jpy_rate():
     try:
         url = "https://api.exchangerate-api.com/v4/latest/USD"
-        response = requests.get(url, timeout=5)
+        response = http_get(url)
         data = response.json()
         return data["rates"]["JPY"]
     except:
         return 150.0
 
-@st.cache_data(ttl=600)
-def get_crypto_prices(symbols):
-    prices = {}
-    valid_symbols = [str(sym).upper() for sym in symbols if sym]
-    cg_ids = [c.CRYPTO_ID_MAP[sym] for sym in valid_symbols if sym in c.CRYPTO_ID_MAP]
-    if not cg_ids:
-        return prices
-    ids_str = ",".join(cg_ids)
+# ==========================================
+# 各プロバイダーの取得関数
+# ==========================================
+# 引数は取得元のキー（CoinGecko の ID・コントラクトアドレス・ティッカー）のリストで、
+# {キー: 円価格} を返す。価格が存在しないと分かったキーは None、
+# 通信エラー等で分からなかったキーは結果に含めない（次回また問い合わせる）。
+def _fetch_coingecko(cg_ids):
     url = "https://api.coingecko.com/api/v3/simple/price"
     params = {
-        'ids': ids_str,
+        'ids': ",".join(cg_ids),
         'vs_currencies': 'jpy'
     }
-    try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        for sym in valid_symbols:
-            if sym in c.CRYPTO_ID_MAP:
-                cg_id = c.CRYPTO_ID_MAP[sym]
-                if cg_id in data and 'jpy' in data[cg_id]:
-                    prices[sym] = float(data[cg_id]['jpy'])
-    except Exception:
-        pass
-    return prices
+    response = http_get(url, params=params)
+    response.raise_for_status()
+    data = response.json()
+    return {cg_id: float(data[cg_id]['jpy']) if 'jpy' in data.get(cg_id, {}) else None for cg_id in cg_ids}
 
-@st.cache_data(ttl=600)
-def get_meme_prices(symbols):
+def _get_dex_price_usd(address):
+    dex_url = f"https://api.dexscreener.com/latest/dex/tokens/{address}"
+    res = http_get(dex_url).json()
+    if res.get("pairs"):
+        return float(res["pairs"][0].get("priceUsd", 0))
+    return None
+
+def _fetch_dexscreener(addresses):
+    usd_jpy_rate = get_usd_jpy_rate()
     prices = {}
+    # DexScreener へはトークンごとに並行して問い合わせる
+    with ThreadPoolExecutor(max_workers=len(addresses)) as executor:
+        futures = {address: executor.submit(_get_dex_price_usd, address) for address in addresses}
+    for address, future in futures.items():
+        try:
+            price_usd = future.result()
+        except Exception:
+            continue
+        prices[address] = price_usd * usd_jpy_rate if price_usd is not None else None
+    return prices
+
+def _fetch_yfinance_metals(tickers):
+    """yfinance で全ティッカーの直近終値を1回のダウンロードで取得し、税込みの1gあたりの円価格にする"""
+    data = yf.download(list(tickers), period="5d", progress=False, threads=False)
+    close = data['Close']
+    if isinstance(close, pd.Series):
+        close = close.to_frame(tickers[0])
     usd_jpy_rate = get_usd_jpy_rate()
-    for sym in symbols:
-        key = sym.upper()
-        if key in c.MEME_CONTRACTS:
-            address = c.MEME_CONTRACTS[key]
-            dex_url = f"https://api.dexscreener.com/latest/dex/tokens/{address}"
-            try:
-                res = requests.get(dex_url, timeout=5).json()
-                if res.get("pairs"):
-                    price_usd = float(res["pairs"][0].get("priceUsd", 0))
-                    prices[sym] = price_usd * usd_jpy_rate
-            except:
-                prices[sym] = 0.0
+    prices = {}
+    for ticker in tickers:
+        if ticker in close.columns:
+            series = close[ticker].dropna()
+            if not series.empty:
+                # 1トロイオンス(31.1g)あたりのドル価格 → 税込みの1gあたりの円価格
+                prices[ticker] = float(series.iloc[-1] * usd_jpy_rate * 1.1 / 31.1)
     return prices
 
-def get_metal_prices(symbols):
-    target_map = {"Gold": "GC=F", "Silver": "SI=F"}
-    metal_prices = {}
-    try:
-        usd_jpy_rate = get_usd_jpy_rate()
-        for sym in symbols:
-            if sym in target_map:
-                ticker = target_map[sym]
-                data = yf.Ticker(ticker)
-                price_usd = data.history(period="5d")['Close'].iloc[-1]
-                metal_prices[sym] = float(price_usd * usd_jpy_rate * 1.1 / 31.1)
-    except Exception:
-        pass
-    return metal_prices
\ No newline at end of file
+# ==========================================
+# ★ 価格プロバイダーの登録と銘柄の振り分け
+# ==========================================
+# 銘柄はここに並んだ順に、最初に見つかった1つのプロバイダーへ振り分ける。
+# ttl はそのプロバイダーの価格を取り直すまでの秒数。
+PRICE_PROVIDERS = {
+    '暗号資産': {'symbols': c.CRYPTO_ID_MAP, 'fetch': _fetch_coingecko, 'ttl': 600},
+    'ミームコイン': {'symbols': c.MEME_CONTRACTS, 'fetch': _fetch_dexscreener, 'ttl': 300},
+    '貴金属': {'symbols': c.METAL_TICKERS, 'fetch': _fetch_yfinance_metals, 'ttl': 1800},
+}
+
+# 価格が存在しないと返ってきたキーを、再び問い合わせるまでの秒数
+NEGATIVE_CACHE_TTL_SEC = 60 * 60
+
+class PriceRegistry:
+    """
+    銘柄 → (プロバイダー名, 取得元のキー) の振り分けと、キーごとの価格をプロセス内で保持する。
+    どのプロバイダーにも無い銘柄や、価格が無いと分かったキーは覚えておき、通信しない。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._quotes = {}
+        self._misses = {}
+        self._in_flight = set()
+
+    def _route(self, symbol):
+        """銘柄の振り分け先を返す（一度決めたら覚えておく）。どこにも無ければ None"""
+        if symbol not in self._routes:
+            key = str(symbol).upper()
+            self._routes[symbol] = None
+            for name, provider in PRICE_PROVIDERS.items():
+                upper_map = {str(k).upper(): v for k, v in provider['symbols'].items()}
+                if key in upper_map:
+                    self._routes[symbol] = (name, upper_map[key])
+                    break
+        return self._routes[symbol]
+
+    def plan(self, symbols):
+        """
+        取得が必要なキーをプロバイダーごとにまとめて返す: {プロバイダー名: [キー, ...]}
+        TTL内の価格がある・価格が無いと分かっている・別のスレッドが取得中のキーは含めない。
+        同じキーに振り分けられる銘柄が複数あっても1回だけ問い合わせる。
+        """
+        now = time.time()
+        plan = {}
+        with self._lock:
+            for symbol in symbols:
+                route = self._route(symbol)
+                if route is None or route in self._in_flight:
+                    continue
+                name, key = route
+                quote = self._quotes.get(route)
+                if quote is not None and now - quote[1] < PRICE_PROVIDERS[name]['ttl']:
+                    continue
+                if now - self._misses.get(route, 0) < NEGATIVE_CACHE_TTL_SEC:
+                    continue
+                self._in_flight.add(route)
+                plan.setdefault(name, []).append(key)
+        return plan
+
+    def store(self, name, keys, prices):
+        """取得結果を記録し、取得中の印を外す。prices が None なら失敗（何も記録しない）"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                route = (name, key)
+                self._in_flight.discard(route)
+                if prices is None or key not in prices:
+                    continue
+                if prices[key] is None:
+                    self._misses[route] = now
+                else:
+                    self._quotes[route] = (prices[key], now)
+                    self._misses.pop(route, None)
+
+    def prices_for(self, symbols):
+        """手元にある価格（TTL切れでも最新のもの）を銘柄ごとに返す"""
+        with self._lock:
+            prices = {}
+            for symbol in symbols:
+                route = self._route(symbol)
+                if route is not None and route in self._quotes:
+                    prices[symbol] = self._quotes[route][0]
+            return prices
+
+    def unpriceable(self, symbols):
+        """どのプロバイダーにも振り分けられない銘柄"""
+        with self._lock:
+            return [symbol for symbol in symbols if self._route(symbol) is None]
+
+@st.cache_resource
+def get_price_registry():
+    return PriceRegistry()
+
+def unpriceable_symbols(symbols):
+    return get_price_registry().unpriceable([sym for sym in symbols if sym])
+
+# ==========================================
+# ★ 全プロバイダーの価格を並行取得する
+# ==========================================
+@st.cache_resource
+def _get_price_executor():
+    return ThreadPoolExecutor(max_workers=len(PRICE_PROVIDERS) * 2, thread_name_prefix='price-fetch')
+
+def _timed_call(func, keys):
+    started = time.perf_counter()
+    result = func(keys)
+    return result, time.perf_counter() - started
+
+def fetch_all_prices(symbols, deadline=PRICE_FETCH_DEADLINE_SEC):
+    """
+    取得が必要なキーだけを、プロバイダーごとに同時に問い合わせる。
+    deadline 秒を過ぎたら待つのをやめ、その時点で手元にある価格を返す
+    （遅れて返ってきた結果も、届いた時点で registry に記録される）。
+    戻り値: (価格の辞書, {問い合わせたプロバイダー名: 所要秒数。時間切れ・失敗は None})
+    """
+    symbols = [sym for sym in symbols if sym]
+    registry = get_price_registry()
+    executor = _get_price_executor()
+
+    def record(name, keys):
+        def callback(future):
+            try:
+                result, _ = future.result()
+            except Exception:
+                result = None
+            registry.store(name, keys, result)
+        return callback
+
+    futures = {}
+    for name, keys in registry.plan(symbols).items():
+        future = executor.submit(_timed_call, PRICE_PROVIDERS[name]['fetch'], keys)
+        future.add_done_callback(record(name, keys))
+        futures[future] = name
+    done, _ = wait(futures, timeout=deadline)
+
+    latencies = {name: None for name in futures.values()}
+    for future in done:
+        try:
+            _, elapsed = future.result()
+        except Exception:
+            continue
+        latencies[futures[future]] = elapsed
+    return registry.prices_for(symbols), latencies
+
+# ==========================================
+# ★ バックグラウンドでの価格の更新（画面描画は通信を待たない）
+# ==========================================
+class PriceRefresher:
+    """
+    プロセスに1つだけ起動し、登録された銘柄の価格と USD/JPY をバックグラウンドで取得し続ける。
+    画面側は snapshot() で手元にある最新の値を待たずに読むだけ。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._symbols = set()
+        self._prices = {}
+        self._latencies = {}
+        self._usd_jpy_rate = None
+        self._fetched_at = None
+        self._attempted_at = None
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, name='price-refresher', daemon=True)
+        self._thread.start()
+
+    def watch(self, symbols):
+        """取得対象の銘柄を登録する。新しい銘柄があればすぐに取得を始める"""
+        new_symbols = {str(sym) for sym in symbols if sym} - self._symbols
+        if new_symbols:
+            with self._lock:
+                self._symbols |= new_symbols
+            self._wakeup.set()
+
+    def snapshot(self):
+        """
+        手元にある最新の値を返す（通信はしない）。
+        戻り値: {'prices', 'fetched_at', 'attempted_at', 'latencies', 'usd_jpy_rate', 'generation'}
+        fetched_at / attempted_at は time.time() の値で、まだ無ければ None
+        """
+        with self._lock:
+            return {
+                'prices': dict(self._prices),
+                'fetched_at': self._fetched_at,
+                'attempted_at': self._attempted_at,
+                'latencies': dict(self._latencies),
+                'usd_jpy_rate': self._usd_jpy_rate,
+                'generation': self._generation,
+            }
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=PRICE_REFRESH_INTERVAL_SEC)
+            self._wakeup.clear()
+            with self._lock:
+                symbols = sorted(self._symbols)
+            if symbols:
+                self._refresh(symbols)
+
+    def _refresh(self, symbols):
+        try:
+            prices, latencies = fetch_all_prices(symbols)
+        except Exception:
+            prices, latencies = {}, {}
+        try:
+            usd_jpy_rate = get_usd_jpy_rate()
+        except Exception:
+            usd_jpy_rate = None
+        # TTL内のプロバイダーには問い合わせないので、実際に新しい価格が届いたときだけ更新扱いにする
+        fetched = any(sec is not None for sec in latencies.values())
+        with self._lock:
+            self._attempted_at = time.time()
+            if latencies:
+                self._latencies = latencies
+            if usd_jpy_rate:
+                self._usd_jpy_rate = usd_jpy_rate
+            self._prices.update(prices)
+            if not (fetched and prices):
+                return
+            self._fetched_at = self._attempted_at
+            self._generation += 1
+        # 取得できた価格は履歴にも残す（投資資産の推移グラフ用）
+        try:
+            price_history.record_prices(prices, self._fetched_at)
+        except Exception:
+            pass
+
+@st.cache_resource
+def get_price_refresher():
+    return PriceRefresher()
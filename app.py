@@ -2,7 +2,7 @@ import streamlit as st
 import datetime
 import pandas as pd
 import const as c
-import gsheets
+import storage
 
 # 切り出した画面パーツを読み込む
 import ui_input
@@ -31,35 +31,40 @@ JST = datetime.timezone(datetime.timedelta(hours=+9), 'JST')
 today_jst = datetime.datetime.now(JST).date()
 today_ts = pd.Timestamp.now(tz='Asia/Tokyo').normalize().tz_localize(None)
 
-worksheet = gsheets.get_worksheet(st.session_state["target_sheet"])
-df = gsheets.load_kakeibo_data(worksheet)
-df_investment = gsheets.load_investment_data(worksheet)
+# ★ 保存先（スプレッドシート / SQLite）はユーザーごとの設定で切り替える
+store = storage.open_storage(users_cfg[url_user_id])
+# ★ 前回までに送り切れなかった入力があれば、バックグラウンドで送り始める
+store.start()
+# ★ 画面描画に必要なシートは1回のリクエストでまとめて読み込む
+sheet_data = store.load_all_data()
+df = sheet_data['家計簿']
+df_investment = sheet_data['投資']
+df_sub = sheet_data['サブスク']
 
 if "subscriptions_auto_added" not in st.session_state:
-    added_count = gsheets.auto_add_subscriptions(worksheet, df)
+    added_count = store.auto_add_subscriptions(df, df_sub)
     if added_count > 0:
         st.toast(f"📅 今月のサブスク {added_count}件 を自動で家計簿に追加しました！", icon="✅")
-        df = gsheets.load_kakeibo_data(worksheet)
     st.session_state["subscriptions_auto_added"] = True
 
 # ==========================================
 # 画面の描画（各ファイルを順番に呼び出す）
 # ==========================================
 
-ui_input.render(worksheet, today_jst)
+ui_input.render(store, today_jst)
 st.divider()
 
-# ★ 修正: キャッシュの保存/読込のために worksheet を引数に追加
-yen_assets = ui_dashboard.render(df, df_investment, today_ts, worksheet)
+# ★ 修正: キャッシュの保存/読込のために store を引数に追加
+yen_assets = ui_dashboard.render(df_investment, today_ts, store, sheet_data['価格キャッシュ'])
 st.divider()
 
-ui_history.render(df, worksheet)
+ui_history.render(df, store)
 st.divider()
 
-ui_subscription.render(worksheet)
+ui_subscription.render(store, df_sub)
 st.divider()
 
-ui_tools.render_asset_check(worksheet, yen_assets, today_jst)
+ui_tools.render_asset_check(store, yen_assets, today_jst)
 st.divider()
 
-ui_tools.render_memo(worksheet)
\ No newline at end of file
+ui_tools.render_memo(store, sheet_data['なんでもメモ'])
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+家計簿への追記と、キャッシュ切れの再読み込みにかかる通信量を、シートの行数ごとに測るベンチマーク。
+
+    python bench_append.py                               # 1k / 10k / 100k 行
+    python bench_append.py --sizes 1000 --appends 10 --output bench_output.txt
+
+Google Sheets の代わりに手元の FakeSpreadsheet を使う。values.get は Sheets と同じく
+書式を適用した文字列（金額などの数値も文字列）を返し、values.append は指定した範囲を含む
+表の直後に書き込む。通信時間は「1リクエストの往復時間 + 読んだセル数 × セルあたりの時間」で見積もる。
+差分読み込みが効いていれば、追記1回・再読み込み1回あたりの数字はシートの行数によらずほぼ一定になる。
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+import gsheets
+import snapshot
+from bench_decoder import synthetic_rows
+
+HEADER = ['日付', '区分', 'カテゴリー', '金額', 'メモ']
+
+def _render(value, formatted):
+    """シートに RAW で書き込んだ値を、values.get で読んだときの形にする"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if not formatted:
+        return value
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+class FakeSpreadsheet:
+    """gsheets.py が使う Spreadsheet のメソッドだけを持つ、メモリ上のスプレッドシート"""
+    def __init__(self, sheets):
+        self.id = f"bench-{os.getpid()}-{time.monotonic_ns()}"
+        self.sheets = sheets
+        self.requests = 0
+        self.cells = 0
+        self._modified = 0
+
+    def _range(self, range_name, formatted=True):
+        name, a1 = range_name.rsplit('!', 1)
+        rows = self.sheets[name.strip("'")]
+        m = re.fullmatch(r"([A-Z])(\d*)(?::([A-Z])(\d*))?", a1)
+        first_col, last_col = ord(m.group(1)) - 65, ord(m.group(3) or m.group(1)) - 65
+        first_row = int(m.group(2) or 1)
+        last_row = int(m.group(4)) if m.group(4) else (first_row if m.group(3) is None else len(rows))
+        out = []
+        for row in rows[first_row - 1:last_row]:
+            cells = [_render(v, formatted) for v in row[first_col:last_col + 1]]
+            while cells and cells[-1] == "":
+                cells.pop()
+            out.append(cells)
+        while out and not out[-1]:
+            out.pop()
+        self.cells += sum(len(row) for row in out)
+        return {'values': out} if out else {}
+
+    def values_get(self, range_name, params=None):
+        self.requests += 1
+        formatted = (params or {}).get('valueRenderOption', 'FORMATTED_VALUE') == 'FORMATTED_VALUE'
+        return self._range(range_name, formatted)
+
+    def values_batch_get(self, ranges, params=None):
+        self.requests += 1
+        return {'valueRanges': [self._range(r) for r in ranges]}
+
+    def values_append(self, range_name, params=None, body=None):
+        self.requests += 1
+        self._modified += 1
+        name, a1 = range_name.rsplit('!', 1)
+        name = name.strip("'")
+        rows = self.sheets.setdefault(name, [])
+        # 指定した行から下へ続く表の直後に書き込む
+        pos = int(re.search(r'\d+', a1).group())
+        while pos <= len(rows) and any(v != "" for v in rows[pos - 1]):
+            pos += 1
+        rows[pos - 1:pos - 1] = [list(row) for row in body['values']]
+        updated = f"'{name}'!A{pos}:E{pos + len(body['values']) - 1}"
+        updates = {'updatedRange': updated}
+        if (params or {}).get('includeValuesInResponse'):
+            updates['updatedData'] = {'values': [[_render(v, True) for v in row] for row in body['values']]}
+        return {'updates': updates}
+
+    def values_update(self, range_name, params=None, body=None):
+        self.requests += 1
+        self._modified += 1
+        name = range_name.rsplit('!', 1)[0].strip("'")
+        self.sheets[name][:len(body['values'])] = [list(row) for row in body['values']]
+
+    def get_lastUpdateTime(self):
+        self.requests += 1
+        return str(self._modified)
+
+    def worksheets(self):
+        self.requests += 1
+        return [type('Worksheet', (), {'title': name})() for name in self.sheets]
+
+def _measure(sh, func):
+    requests, cells = sh.requests, sh.cells
+    t0 = time.perf_counter()
+    func()
+    return sh.requests - requests, sh.cells - cells, time.perf_counter() - t0
+
+def run(sizes, appends, latency_ms, cell_us):
+    lines = [f"通信時間の見積もり: 1リクエスト {latency_ms}ms + 1セル {cell_us}µs / 追記は {appends} 回の平均",
+             f"{'行数':>9} {'操作':<10} {'リクエスト':>8} {'読んだセル':>10} {'処理 ms':>8} {'見積もり ms':>10}"]
+    print("\n".join(lines), flush=True)
+    for n in sizes:
+        sh = FakeSpreadsheet({
+            '家計簿': [HEADER] + synthetic_rows(n),
+            '投資': [], 'サブスク': [], '価格キャッシュ': [], 'なんでもメモ': [],
+        })
+        results = {'初回読み込み': [_measure(sh, lambda: gsheets.load_all_data(sh))]}
+        for i in range(appends):
+            row = ['2026-10-18', '支出', '食費', 100 + i, f'bench{i}']
+            results.setdefault('追記', []).append(_measure(sh, lambda: gsheets._append_rows(sh, {'家計簿': [row]})))
+            gsheets._invalidate(sh, '家計簿')
+            results.setdefault('再読み込み', []).append(_measure(sh, lambda: gsheets.load_kakeibo_data(sh)))
+        for label, samples in results.items():
+            requests, cells, seconds = (sum(v) / len(samples) for v in zip(*samples))
+            estimate = requests * latency_ms + cells * cell_us / 1000 + seconds * 1000
+            lines.append(f"{n:>9,} {label:<10} {requests:>8.1f} {cells:>10,.0f} {seconds * 1000:>8.1f} {estimate:>10.1f}")
+            print(lines[-1], flush=True)
+        snapshot.drop_snapshot(sh.id, '家計簿')
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--appends', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=150)
+    parser.add_argument('--cell-us', type=float, default=2)
+    parser.add_argument('--output', help="結果を書き出すファイル（例: bench_output.txt）")
+    args = parser.parse_args()
+    # 本物のスナップショットと混ざらないよう、一時ディレクトリに保存する
+    snapshot.SNAPSHOT_DIR = tempfile.mkdtemp(prefix='bench_append_')
+    lines = run(args.sizes, args.appends, args.latency_ms, args.cell_us)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+家計簿の DataFrame のメモリ使用量を測るベンチマーク（decoder.compact_ledger の前後）。
+
+    python bench_compact_ledger.py                       # 100k / 1M 行
+    python bench_compact_ledger.py --unique-memos 0.5 --output bench_output.txt
+
+bench_decoder.py と同じ合成データを変換し、型を詰める前（区分・カテゴリー・メモが文字列、
+No・金額が int64）と詰めた後の memory_usage(deep=True) の合計を比べる。
+詰める前は、以前の家計簿と同じ object 型の文字列と、pandas の既定の文字列型（pandas 3 では
+Arrow を使う str 型で、object 型より小さい）の両方を測る。
+--unique-memos で重複しないメモの割合を変えられる（割合が高いほど category 型の効果は小さい）。
+"""
+import argparse
+import random
+import numpy as np
+import pandas as pd
+import decoder
+import gsheets
+from bench_decoder import synthetic_rows
+
+def _loose_ledger(rows):
+    """型を詰める前の家計簿の DataFrame（gsheets._parse_kakeibo_rows から compact_ledger を除いたもの）"""
+    df = decoder.to_frame(rows, gsheets.KAKEIBO_COLUMNS[1:])
+    df.insert(0, 'No', np.arange(1, len(df) + 1))
+    df['金額'] = decoder.parse_ints(df['金額'])
+    df['日付'] = decoder.parse_dates(df['日付'])
+    return df
+
+def _as_object_strings(df):
+    columns = decoder.LEDGER_CATEGORY_COLUMNS
+    return df.assign(**{col: df[col].astype(object) for col in columns})
+
+def _with_unique_memos(rows, ratio, seed=0):
+    """ratio の割合の行のメモを、他と重複しない文字列に置き換える"""
+    rng = random.Random(seed)
+    return [
+        gsheets._pad_row(row)[:4] + [f'メモ{i}'] if rng.random() < ratio else row
+        for i, row in enumerate(rows)
+    ]
+
+def _megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def run(sizes, unique_memos):
+    lines = [f"pandas {pd.__version__} / 重複しないメモの割合 {unique_memos:.0%}",
+             f"{'行数':>9} {'object 型 MB':>13} {'既定の型 MB':>12} {'詰めた後 MB':>12} {'比':>6}"]
+    print("\n".join(lines), flush=True)
+    for n in sizes:
+        loose = _loose_ledger(_with_unique_memos(synthetic_rows(n), unique_memos))
+        compact = decoder.compact_ledger(loose)
+        before, default, after = _megabytes(_as_object_strings(loose)), _megabytes(loose), _megabytes(compact)
+        lines.append(f"{n:>9,} {before:>13.1f} {default:>12.1f} {after:>12.1f} {before / after:>5.1f}x")
+        print(lines[-1], flush=True)
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--unique-memos', type=float, default=0.0)
+    parser.add_argument('--output', help="結果を書き出すファイル（例: bench_output.txt）")
+    args = parser.parse_args()
+    lines = run(args.sizes, args.unique_memos)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == '__main__':
+    main()
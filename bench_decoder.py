@@ -0,0 +1,87 @@
+"""
+家計簿シートの生データ → DataFrame の変換速度を測るベンチマーク。
+
+    python bench_decoder.py                      # 10k / 100k / 1M 行
+    python bench_decoder.py --sizes 10000 --repeat 5 --output bench_output.txt
+
+values.get の結果を模した行（'-' と '/' の日付の混在、桁区切り付きの金額、
+メモの無い短い行を含む）を作り、decoder を使う今の変換（gsheets._parse_kakeibo_rows）と、
+1行ずつリストを作って書式を指定せずに日付を読む以前の変換とを比べる。
+"""
+import argparse
+import random
+import time
+import pandas as pd
+import decoder
+import gsheets
+
+CATEGORIES = ['食費', '日用品', '交通費', '交際費', '趣味', '給与', '資産調整']
+MEMOS = ['', 'スーパー', 'コンビニ', 'ランチ', '電車', 'ドラッグストア', '本', '給料']
+
+def synthetic_rows(n, seed=0):
+    """家計簿シートの行（ヘッダー除く）を n 行作る"""
+    rng = random.Random(seed)
+    start = pd.Timestamp('2015-01-01')
+    rows = []
+    for i in range(n):
+        day = start + pd.Timedelta(days=i * 3650 // max(n, 1))
+        sep = '-' if rng.random() < 0.3 else '/'
+        amount = rng.randint(100, 300000)
+        row = [
+            day.strftime(f'%Y{sep}%m{sep}%d'),
+            '収入' if rng.random() < 0.1 else '支出',
+            rng.choice(CATEGORIES),
+            f'{amount:,}' if rng.random() < 0.2 else str(amount),
+            rng.choice(MEMOS),
+        ]
+        # シートは末尾の空セルを返さないので、メモが空の行は短くなる
+        rows.append(row if row[-1] else row[:-1])
+    return rows
+
+def _legacy_parse_kakeibo_rows(rows, start_no=1):
+    """decoder を使う前の変換（比較用）"""
+    data = [[start_no + i] + gsheets._pad_row(row) for i, row in enumerate(rows)]
+    df = pd.DataFrame(data, columns=gsheets.KAKEIBO_COLUMNS)
+    df = df[df['日付'].astype(str).str.strip() != ""]
+    df['金額'] = pd.to_numeric(df['金額'].astype(str).str.replace(',', ''), errors='coerce').fillna(0).astype(int)
+    df['日付'] = df['日付'].astype(str).str.strip().str.replace('-', '/')
+    df['日付'] = pd.to_datetime(df['日付'], errors='coerce')
+    return df
+
+def _best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run(sizes, repeat):
+    lines = [f"pandas {pd.__version__} / 最速 {repeat} 回中（秒）",
+             f"{'行数':>9} {'以前':>8} {'現在':>8} {'to_frame':>9} {'日付':>8} {'金額':>8}"]
+    print("\n".join(lines), flush=True)
+    for n in sizes:
+        rows = synthetic_rows(n)
+        frame = decoder.to_frame(rows, gsheets.KAKEIBO_COLUMNS[1:])
+        legacy = _best_of(lambda: _legacy_parse_kakeibo_rows(rows), repeat)
+        current = _best_of(lambda: gsheets._parse_kakeibo_rows(rows), repeat)
+        to_frame = _best_of(lambda: decoder.to_frame(rows, gsheets.KAKEIBO_COLUMNS[1:]), repeat)
+        dates = _best_of(lambda: decoder.parse_dates(frame['日付']), repeat)
+        ints = _best_of(lambda: decoder.parse_ints(frame['金額']), repeat)
+        lines.append(f"{n:>9,} {legacy:>8.3f} {current:>8.3f} {to_frame:>9.3f} {dates:>8.3f} {ints:>8.3f}")
+        print(lines[-1], flush=True)
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="結果を書き出すファイル（例: bench_output.txt）")
+    args = parser.parse_args()
+    lines = run(args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,52 @@
 import altair as alt
+import numpy as np
+import const as c
+
+# ==========================================
+# ★ 長い系列の間引き
+# ==========================================
+# 全期間のグラフは日数が増えるほど点が増え、そのままページに埋め込まれる。
+# CHART_MAX_POINTS を超える系列は、見た目の形が変わらないように点を選んでから描く。
+# - 折れ線: LTTB（各区間から、前後の点と作る三角形が最も大きい点を選ぶ）
+# - 棒: 各区間の最小と最大の棒を残す（突出した支出が消えないようにする）
+
+def _lttb_indexes(x, y, max_points):
+    n = len(x)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = [0]
+    for start, end, next_end in zip(edges[:-1], edges[1:], np.append(edges[2:], n)):
+        # 次の区間の平均の点と、直前に選んだ点を結ぶ三角形の面積が最大の点を選ぶ
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        prev_x, prev_y = x[selected[-1]], y[selected[-1]]
+        area = np.abs((prev_x - next_x) * (y[start:end] - prev_y) - (prev_x - x[start:end]) * (next_y - prev_y))
+        selected.append(start + int(area.argmax()))
+    selected.append(n - 1)
+    return np.array(selected)
+
+def downsample_lttb(data, x_col, y_col, max_points=c.CHART_MAX_POINTS):
+    """折れ線の系列を最大 max_points 点に間引く（最初と最後の点は必ず残す）"""
+    if len(data) <= max_points or max_points < 3:
+        return data
+    x = data[x_col].to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+    y = data[y_col].to_numpy(dtype=float)
+    return data.iloc[_lttb_indexes(x, y, max_points)]
+
+def downsample_minmax(data, y_col, max_points=c.CHART_MAX_POINTS):
+    """棒の系列を、区間ごとに最小と最大の行だけ残して最大 max_points 行に間引く"""
+    if len(data) <= max_points or max_points < 2:
+        return data
+    y = data[y_col].to_numpy(dtype=float)
+    edges = np.linspace(0, len(y), max_points // 2 + 1).astype(int)
+    selected = set()
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            selected.update((start + int(y[start:end].argmin()), start + int(y[start:end].argmax())))
+    return data.iloc[sorted(selected)]
 
 def create_balance_chart(data, x_col, x_format, tooltip_format, x_label_angle=0):
-    line_data = data.groupby(x_col)['現金推移'].last().reset_index()
-    line = alt.Chart(line_data).mark_line(color="#498dd1", point=True).encode(
+    # data は期間ごとに集計済みの [x_col, 現金推移]（dashboard_data.py）
+    data = downsample_lttb(data, x_col, '現金推移')
+    line = alt.Chart(data).mark_line(color="#498dd1", point=True).encode(
         # X軸の後ろに :T (Temporal) を付与
         x=alt.X(f"{x_col}:T", axis=alt.Axis(format=x_format, title=None, labelAngle=x_label_angle)),
         # scale=alt.Scale(zero=False) により、縦軸の最小値・最大値がデータに合わせて自動調整されます
@@ -14,10 +58,22 @@ def create_balance_chart(data, x_col, x_format, tooltip_format, x_label_angle=0)
     ).properties(height=250)
     return line.configure_axis(labelColor='#703B3B', titleColor='#703B3B', gridColor='#e0e0e0')
 
+def create_investment_chart(data, x_col, x_format, tooltip_format, x_label_angle=0):
+    line_data = downsample_lttb(data.groupby(x_col)['評価額'].last().reset_index(), x_col, '評価額')
+    line = alt.Chart(line_data).mark_line(color="#ff8c00", point=True).encode(
+        x=alt.X(f"{x_col}:T", axis=alt.Axis(format=x_format, title=None, labelAngle=x_label_angle)),
+        y=alt.Y('評価額:Q', scale=alt.Scale(zero=False), axis=alt.Axis(title='投資資産 (円)', grid=True)),
+        tooltip=[
+            alt.Tooltip(f"{x_col}:T", format=tooltip_format, title='期間'),
+            alt.Tooltip('評価額:Q', format=',.0f', title='評価額')
+        ]
+    ).properties(height=250)
+    return line.configure_axis(labelColor='#703B3B', titleColor='#703B3B', gridColor='#e0e0e0')
+
 def create_expense_chart(data, x_col, x_format, tooltip_format, x_label_angle=0):
-    exp_data = data[data['区分'] == '支出']
-    bar_data = exp_data.groupby(x_col)['金額'].sum().reset_index()
-    bars = alt.Chart(bar_data).mark_bar(color="#A03333").encode(
+    # data は期間ごとに集計済みの [x_col, 金額]（dashboard_data.py）
+    data = downsample_minmax(data, '金額')
+    bars = alt.Chart(data).mark_bar(color="#A03333").encode(
         x=alt.X(f"{x_col}:T", axis=alt.Axis(format=x_format, title=None, labelAngle=x_label_angle)),
         y=alt.Y('金額:Q', axis=alt.Axis(title='支出 (円)', grid=True)),
         tooltip=[
@@ -1,3 +1,5 @@
+import os
+
 # --- 変わらない定数の設定 ---
 
 # 会計簿のカテゴリー
@@ -27,11 +29,27 @@ CRYPTO_ID_MAP = {
     'DOGE': 'dogecoin',
     'BNB': 'binancecoin'
 }
+# 貴金属の yfinance ティッカー
+METAL_TICKERS = {
+    'Gold': 'GC=F',
+    'Silver': 'SI=F'
+}
 MEME_CONTRACTS = {
     '114514': 'AGdGTQa8iRnSx4fQJehWo4Xwbh1bzTazs55R6Jwupump',
     '42069': 'FquUHKWfMUdSMxxSU9ZWrSc98hvTXeMnQn9nksSKpump'
 }
 
+# スナップショットや価格履歴など、ローカルに保存するファイルの置き場所
+LOCAL_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.kakeibo_cache')
+
+# 価格キャッシュシートへの保存条件
+# 前回保存した価格からこの割合以上変わった銘柄があるか、前回の保存からこの秒数が経ったときだけ保存する
+PRICE_CACHE_CHANGE_THRESHOLD = 0.005
+PRICE_CACHE_SAVE_INTERVAL_SEC = 60 * 60
+
+# 推移グラフ1つに描く最大の点数。これより多い期間は形を保ったまま間引いてから描く（charts.py）
+CHART_MAX_POINTS = 400
+
 # 円グラフ・内訳バーのカテゴリーの色
 PIE_CHART_CATEGORIES_COLORS = {
     '食費': "#C54C2D",  
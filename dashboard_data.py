@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+import const as c
+
+# ==========================================
+# ダッシュボード用の集計（Streamlit に依存しない計算部分）
+# ==========================================
+# 家計簿の集計表（rollups.py）から、グラフ・支出内訳・光熱費に使う系列を作る。
+# 集計表は日・月ごとの行しか持たないので、計算量は家計簿の行数ではなく期間の数で決まる。
+# 結果は家計簿のデータのバージョンごとに覚えておき、再描画のたびに計算し直さない。
+# 結果はセッション間で共有されるので、呼び出し側で書き換えないこと。
+
+# グラフに表示する最初の日
+GRAPH_START_DATE = pd.Timestamp('2026-01-01')
+
+# 集計の単位: 列名 → 各日付をその期間の先頭日に変換する関数
+PERIODS = {
+    '日付': lambda dates: dates,
+    '週': lambda dates: dates - pd.to_timedelta(dates.weekday, unit='D'),
+    '年月': lambda dates: dates.to_period('M').to_timestamp(),
+}
+
+# 覚えておく集計結果の数（バージョン × 日付）
+MEMO_SIZE = 4
+
+def _empty_series(x_col, value_col):
+    return pd.DataFrame({x_col: pd.Series(dtype='datetime64[ns]'), value_col: pd.Series(dtype='int64')})
+
+def _period_frame(series, x_col, value_col):
+    return pd.DataFrame({x_col: series.index, value_col: series.to_numpy()})
+
+def build_dashboard_data(tables, today_ts):
+    """
+    家計簿の集計表からダッシュボードの表示に必要な値をまとめて計算する。
+    戻り値の辞書:
+      yen_assets:        今日までの 収入 - 支出
+      balance[期間]:      [期間, 現金推移] 各期間の終わりの現金残高（GRAPH_START_DATE 〜 今日）
+      expense[期間]:      [期間, 金額] 各期間の支出合計（GRAPH_START_DATE 〜 今日）
+      months:            支出内訳に表示する月の一覧（新しい順）
+      month_totals[月]:   その月の支出合計
+      month_categories[月]: その月のカテゴリー別の支出（EXPENSE_CATEGORIES の順、その他は後ろ）
+      utilities:         [年月, 種類, 金額] 光熱費の月別合計
+    """
+    data = {
+        'yen_assets': 0,
+        'balance': {x_col: _empty_series(x_col, '現金推移') for x_col in PERIODS},
+        'expense': {x_col: _empty_series(x_col, '金額') for x_col in PERIODS},
+        'months': [],
+        'month_totals': {},
+        'month_categories': {},
+        'utilities': pd.DataFrame(columns=['年月', '種類', '金額']),
+    }
+    daily = tables['daily']
+    if daily.empty:
+        return data
+
+    past = daily[daily.index <= today_ts]
+    data['yen_assets'] = int(past['収入'].sum() - past['支出'].sum())
+
+    # --- 現金残高と支出の推移（今日までの日だけを使う） ---
+    daily_balance = past['純額'].cumsum()
+    daily_balance = daily_balance[daily_balance.index >= GRAPH_START_DATE]
+    expense_days = past[(past.index >= GRAPH_START_DATE) & (past['支出件数'] > 0)]['支出']
+    for x_col, to_period in PERIODS.items():
+        if not daily_balance.empty:
+            balance = daily_balance.groupby(to_period(daily_balance.index)).last()
+            data['balance'][x_col] = _period_frame(balance, x_col, '現金推移')
+        if not expense_days.empty:
+            expense = expense_days.groupby(to_period(expense_days.index)).sum()
+            data['expense'][x_col] = _period_frame(expense, x_col, '金額')
+
+    # --- 月別の支出内訳（当月は今日より後の日付の支出も含める） ---
+    months = PERIODS['年月'](daily.index).unique()
+    current_month = today_ts.replace(day=1)
+    shown_months = months[(months >= GRAPH_START_DATE) & (months <= current_month)].sort_values(ascending=False)
+    data['months'] = list(shown_months)
+    by_category = tables['category']['金額']
+    category_months = by_category.index.get_level_values('年月')
+    for month in shown_months:
+        cat_totals = by_category[category_months == month].droplevel('年月')
+        ordered = [cat for cat in c.EXPENSE_CATEGORIES if cat in cat_totals.index]
+        others = [cat for cat in cat_totals.index if cat not in ordered]
+        data['month_categories'][month] = cat_totals.reindex(ordered + others)
+        data['month_totals'][month] = int(cat_totals.sum())
+
+    # --- 光熱費（今日までの分を月別に） ---
+    utility = tables['utility']['金額']
+    utility = utility[utility.index.get_level_values('日付') <= today_ts]
+    if not utility.empty:
+        utilities = utility.groupby([
+            utility.index.get_level_values('日付').strftime('%Y-%m').rename('年月'),
+            utility.index.get_level_values('種類'),
+        ]).sum()
+        data['utilities'] = utilities.reset_index()
+
+    return data
+
+def pending_balance(df_pending, today_ts):
+    """未同期（待ち行列にある）行のうち、今日までの 収入 - 支出"""
+    if df_pending.empty:
+        return 0
+    rows = df_pending[df_pending['日付'] <= today_ts]
+    amounts = rows['金額'].astype('int64')
+    return int(amounts[rows['区分'] == '収入'].sum() - amounts[rows['区分'] == '支出'].sum())
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+def get_dashboard_data(tables, today_ts, version=None):
+    """
+    build_dashboard_data の結果を、家計簿のデータのバージョンごとに覚えておいて返す。
+    version が同じでも集計表が作り直されていれば計算し直す。version が None なら毎回計算する。
+    """
+    if version is None:
+        return build_dashboard_data(tables, today_ts)
+    key = (version, today_ts)
+    with _memo_lock:
+        entry = _memo.get(key)
+        if entry is not None and entry[0] is tables:
+            _memo.move_to_end(key)
+            return entry[1]
+    data = build_dashboard_data(tables, today_ts)
+    with _memo_lock:
+        _memo[key] = (tables, data)
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return data
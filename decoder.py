@@ -0,0 +1,68 @@
+import pandas as pd
+
+# ==========================================
+# シートの生データ → 型付きの DataFrame への変換（共通処理）
+# ==========================================
+# values.get の結果は「行ごとに長さが違う文字列のリスト」なので、
+# 1行ずつ Python で処理せず、列単位でまとめて変換する。
+
+# シートに入っている日付の書式（'-' 区切りは '/' に揃えてから読む）
+DATE_FORMAT = '%Y/%m/%d'
+
+def to_frame(rows, columns):
+    """
+    長さが揃っていない行のリストを、全列が文字列の DataFrame にする。
+    足りないセルは空文字で埋め、列数を超えるセルは捨てる。
+    """
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame.from_records(rows)
+    df = df.reindex(columns=range(len(columns)))
+    df.columns = columns
+    return df.fillna("").astype(str)
+
+def parse_dates(values):
+    """
+    日付の列を datetime64 にする。書式を指定して一括で変換し、
+    書式に合わなかった文字列（時刻付きなど）だけを推測で読み直す。読めない値は NaT。
+    """
+    s = pd.Series(values).astype(str).str.strip().str.replace('-', '/', regex=False)
+    dates = pd.to_datetime(s, format=DATE_FORMAT, errors='coerce')
+    leftover = dates.isna() & (s != "")
+    if leftover.any():
+        dates[leftover] = pd.to_datetime(s[leftover], format='mixed', errors='coerce')
+    return dates
+
+def parse_ints(values, default=0):
+    """金額などの整数の列を int にする（'1,000' のような桁区切りも読む）。読めない値は default"""
+    s = pd.Series(values).astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(s, errors='coerce').fillna(default).astype(int)
+
+def parse_floats(values, default=0.0):
+    """数量などの小数の列を float にする。読めない値は default"""
+    s = pd.Series(values).astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(s, errors='coerce').fillna(default).astype(float)
+
+# ==========================================
+# 家計簿の DataFrame をメモリの少ない型にする
+# ==========================================
+# 区分・カテゴリー・メモは同じ文字列が何度も出てくるので category 型（値は1回だけ持ち、
+# 各行は番号で参照する）にし、No・金額は 32bit 整数にする（範囲を超える金額があれば 64bit のまま）。
+# 合計や累計を計算するときは int64 に戻してから行うこと。
+
+LEDGER_CATEGORY_COLUMNS = ['区分', 'カテゴリー', 'メモ']
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+def _narrow_int(values):
+    if len(values) and (values.min() < INT32_MIN or values.max() > INT32_MAX):
+        return values.astype('int64')
+    return values.astype('int32')
+
+def compact_ledger(df):
+    """家計簿の DataFrame（No・日付・区分・カテゴリー・金額・メモ）の型を詰める。pd.concat の後にも呼ぶ"""
+    return df.assign(
+        No=_narrow_int(df['No']),
+        金額=_narrow_int(df['金額']),
+        **{col: df[col].astype(str).astype('category') for col in LEDGER_CATEGORY_COLUMNS},
+    )
@@ -2,8 +2,20 @@ import streamlit as st
 import gspread
 from google.oauth2.service_account import Credentials
 import pandas as pd
+import numpy as np
 import json
+import re
+import threading
+import time
 import calendar
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import const as c
+import decoder
+import rollups
+import sheets_client
+import snapshot
+import write_queue
 
 scopes = [
     'https://www.googleapis.com/auth/spreadsheets',
@@ -34,147 +46,611 @@ def get_worksheet(sheet_name):
         st.error(f"接続エラー: スプレッドシート '{sheet_name}' が見つかりません。共有設定を確認してください。エラー詳細: {e}")
         st.stop()
 
-def load_kakeibo_data(sh):
+# ==========================================
+# ★ パース済みデータのキャッシュ（同じスプレッドシートを使う全セッションで共有）
+# ==========================================
+# シートごとにデータのバージョン番号を持ち、このアプリからの書き込みで番号を上げて
+# キャッシュを無効化する。スプレッドシートを直接編集された分は、Drive の更新日時の
+# 確認（refresh_if_changed）で検知する。TTL は確認できなかった場合の保険。
+DATA_CACHE_TTL_SEC = 60 * 60
+
+# 更新日時を確認する間隔（秒）。この間の再描画では確認もしない
+PROBE_INTERVAL_SEC = 10
+
+@st.cache_resource
+def _data_cache():
+    return {'lock': threading.Lock(), 'versions': {}, 'entries': {}, 'probes': {}, 'rollups': {}, 'sheet_locks': {}}
+
+def get_data_version(sh, sheet_name):
+    """シートのデータのバージョン番号（このアプリから書き込むたびに増える）"""
+    return _data_cache()['versions'].get((sh.id, sheet_name), 0)
+
+def _cache_get(sh, sheet_name):
+    """(ヒットしたか, 値) を返す。バージョンが古い・TTL切れの場合はヒットしない"""
+    cache = _data_cache()
+    key = (sh.id, sheet_name)
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is None:
+            return False, None
+        version, loaded_at, value = entry
+        if version != cache['versions'].get(key, 0) or time.time() - loaded_at > DATA_CACHE_TTL_SEC:
+            return False, None
+        return True, value
+
+def _cache_put(sh, sheet_name, version, value):
+    """読み込み開始時点のバージョンで保存する（読み込み中に書き込みがあれば自動的に古い扱いになる）"""
+    cache = _data_cache()
+    with cache['lock']:
+        cache['entries'][(sh.id, sheet_name)] = (version, time.time(), value)
+
+def _sheet_lock(sh):
+    """
+    スプレッドシートごとの書き換えロック。
+    家計簿のスナップショットとキャッシュを「読む → 変更する → 保存する」処理（追記・削除・差分読み込み）は、
+    待ち行列のスレッドと画面側で同時に走ると片方の変更が消えるので、このロックを持って1つずつ行う。
+    """
+    cache = _data_cache()
+    with cache['lock']:
+        return cache['sheet_locks'].setdefault(sh.id, threading.RLock())
+
+def _invalidate(sh, *sheet_names):
+    """書き込み後に呼び、該当シートのバージョンを上げてキャッシュを捨てる"""
+    cache = _data_cache()
+    with cache['lock']:
+        for name in sheet_names:
+            key = (sh.id, name)
+            cache['versions'][key] = cache['versions'].get(key, 0) + 1
+            cache['entries'].pop(key, None)
+
+def _replace_cached(sh, sheet_name, value):
+    """書き込み内容が手元で分かっている場合は、無効化の代わりに新しい値で置き換える"""
+    cache = _data_cache()
+    with cache['lock']:
+        key = (sh.id, sheet_name)
+        version = cache['versions'].get(key, 0) + 1
+        cache['versions'][key] = version
+        cache['entries'][key] = (version, time.time(), value)
+
+def _read_modified_time(sh):
+    """書き込み直後の更新日時を読む（書き込み前の値と混ざらないよう、まとめ読み（key）はしない）。読めなければ None"""
     try:
-        ws = sh.worksheet('家計簿')
-        all_rows = ws.get_all_values()
+        return sheets_client.read(sh.get_lastUpdateTime)
     except Exception:
-        return pd.DataFrame(columns=['No','日付','区分','カテゴリー','金額','メモ'])
-    
-    columns=['No','日付','区分','カテゴリー','金額','メモ']
-    if len(all_rows) < 2:
-        return pd.DataFrame(columns=columns)
-    data = []
-    for i, row in enumerate(all_rows):
-        if i == 0: continue
-        row_num = i
-        row_data = [row_num] + row[:5]
-        data.append(row_data)
-    df = pd.DataFrame(data, columns=columns)
-    df = df[df['日付'].astype(str).str.strip() != ""]
-    df['金額'] = pd.to_numeric(df['金額'].astype(str).str.replace(',', ''), errors='coerce').fillna(0).astype(int)
-    df['日付'] = df['日付'].astype(str).str.strip().str.replace('-','/')
-    df['日付'] = pd.to_datetime(df['日付'], errors='coerce')
+        return None
+
+def _write(sh, func, *args, **kwargs):
+    """
+    このアプリからの書き込み（sheets_client.write と同じ引数）。
+    書き込みの直後に更新日時を1回だけ読み、その値を「既知」として記録する。
+    次の確認（refresh_if_changed）はこの値と比べるので、自分の書き込みを外部の編集と誤検知しない。
+    前回の確認からこの書き込みまでの間に外部で編集されていた場合は見分けられず、
+    その分はキャッシュの TTL で読み直されるまで反映されない。
+    """
+    with _sheet_lock(sh):
+        result = sheets_client.write(func, *args, **kwargs)
+        after = _read_modified_time(sh)
+        cache = _data_cache()
+        with cache['lock']:
+            probe = cache['probes'].setdefault(sh.id, {})
+            # 読めなかった場合は None にして、次の確認で見た値をそのまま既知とする
+            probe['modified_time'] = after
+            probe['own_writes'] = probe.get('own_writes', 0) + 1
+    return result
+
+def _forget_all(sh):
+    """外部で編集されたときに呼び、全シートのキャッシュを捨てて家計簿も全件取得し直させる"""
+    _invalidate(sh, *ALL_DATA_SHEETS)
+    _sheet_titles.clear()
+    # 途中の行が編集されたかもしれないので、末尾だけの差分読み込みはしない
+    snapshot.drop_snapshot(sh.id, '家計簿')
+
+def refresh_if_changed(sh):
+    """
+    スプレッドシートが直接編集されていないかを、Drive の更新日時だけで確認する（全データは読まない）。
+    外部で変更されていた場合は全シートのキャッシュを捨て、家計簿も全件取得し直させる。
+    変更を検知したら True を返す。
+    """
+    cache = _data_cache()
+    now = time.time()
+    with cache['lock']:
+        probe = cache['probes'].setdefault(sh.id, {})
+        if now - probe.get('checked_at', 0) < PROBE_INTERVAL_SEC:
+            return False
+        probe['checked_at'] = now
+        own_writes = probe.get('own_writes', 0)
+    try:
+        modified_time = sheets_client.read(sh.get_lastUpdateTime, key=('modifiedTime', sh.id))
+    except Exception:
+        return False
+
+    with cache['lock']:
+        if probe.get('own_writes', 0) != own_writes:
+            # 確認中にこのアプリから書き込んだ: 読んだ値は書き込み前のものかもしれないので使わない
+            return False
+        known = probe.get('modified_time')
+        probe['modified_time'] = modified_time
+    if known is None or known == modified_time:
+        return False
+
+    _forget_all(sh)
+    return True
+
+def _cached_load(sh, sheet_name, fetch, default):
+    """
+    キャッシュが有効ならそれを返し、無ければ fetch(sh) で読み込んで保存する。
+    読み込みに失敗した場合は default() を返すが、キャッシュには保存しない
+    （一時的な通信エラーで空のデータが1時間表示され続けないようにする）。
+    """
+    hit, value = _cache_get(sh, sheet_name)
+    if hit:
+        return value
+    version = get_data_version(sh, sheet_name)
+    try:
+        value = fetch(sh)
+    except Exception:
+        return default()
+    _cache_put(sh, sheet_name, version, value)
+    return value
+
+KAKEIBO_COLUMNS = ['No','日付','区分','カテゴリー','金額','メモ']
+
+def _pad_row(row, width=5):
+    return (list(row) + [""] * width)[:width]
+
+def _parse_kakeibo_rows(rows, start_no=1):
+    """家計簿シートの生データ（ヘッダー除く）を DataFrame に変換する。No はシートの行番号 - 1"""
+    if not rows:
+        return pd.DataFrame(columns=KAKEIBO_COLUMNS)
+    df = decoder.to_frame(rows, KAKEIBO_COLUMNS[1:])
+    df.insert(0, 'No', np.arange(start_no, start_no + len(df)))
+    df = df[df['日付'].str.strip() != ""].copy()
+    df['金額'] = decoder.parse_ints(df['金額'])
+    df['日付'] = decoder.parse_dates(df['日付'])
+    return decoder.compact_ledger(df)
+
+def _get_values(sh, range_name):
+    """1つの範囲の値を取得する（worksheet() のメタデータ取得を挟まない）"""
+    return sheets_client.read(sh.values_get, range_name, key=('values_get', sh.id, range_name)).get('values', [])
+
+def _kakeibo_range(snap):
+    """スナップショットがあれば最終行から下だけ、無ければ全体を読む範囲"""
+    return f"'家計簿'!A{snap['row_count']}:E" if snap is not None else "'家計簿'!A:E"
+
+def _apply_kakeibo_tail(sh, snap, tail):
+    """
+    スナップショットの最終行から下（tail）を取り込んで追記する。
+    最終行の内容が変わっていた（削除・編集された）場合は None を返し、全件取得させる。
+    """
+    row_count = snap['row_count']
+    if not tail or _pad_row(tail[0]) != snap['tail_row']:
+        return None
+    new_rows = tail[1:]
+    if not new_rows:
+        _remember_rollups(sh, snap['df'], _snapshot_rollups(snap))
+        return snap['df']
+    new_df = _parse_kakeibo_rows(new_rows, start_no=row_count)
+    df = new_df if snap['df'].empty else decoder.compact_ledger(pd.concat([snap['df'], new_df], ignore_index=True))
+    tables = rollups.add_rows(_snapshot_rollups(snap), new_df)
+    _save_kakeibo_snapshot(sh, df, tables, row_count + len(new_rows), _pad_row(new_rows[-1]), synced_at=snap['synced_at'])
+    return df
+
+def _build_kakeibo_full(sh, all_rows):
+    """全件取得した生データから DataFrame を作り、スナップショットを保存し直す"""
+    df = _parse_kakeibo_rows(all_rows[1:])
+    if all_rows:
+        _save_kakeibo_snapshot(sh, df, rollups.build(df), len(all_rows), _pad_row(all_rows[-1]))
+    else:
+        # シートが空になっていた: 古いスナップショットの最終行を当てにしないように消す
+        snapshot.drop_snapshot(sh.id, '家計簿')
     return df
 
+def load_kakeibo_data(sh):
+    return _cached_load(sh, '家計簿', _fetch_kakeibo_data, _empty_kakeibo)
+
+def _fetch_kakeibo_data(sh):
+    with _sheet_lock(sh):
+        # ★ 前回のスナップショットがあれば、末尾の追加分だけを取得する
+        snap = snapshot.load_snapshot(sh.id, '家計簿')
+        if snap is not None:
+            try:
+                df = _apply_kakeibo_tail(sh, snap, _get_values(sh, _kakeibo_range(snap)))
+            except Exception:
+                df = None
+            if df is not None:
+                return df
+
+        return _load_kakeibo_full(sh)
+
+def _load_kakeibo_full(sh):
+    """全件を読み込む（通信エラーは呼び出し側へそのまま投げる）"""
+    return _build_kakeibo_full(sh, _get_values(sh, _kakeibo_range(None)))
+
+def _empty_kakeibo():
+    return pd.DataFrame(columns=KAKEIBO_COLUMNS)
+
+# ==========================================
+# ★ 家計簿の集計表（ダッシュボード用）
+# ==========================================
+# 集計表はスナップショットと一緒に保存し、行の追加・削除のたびにその分だけ足し引きする。
+# メモリ上では「どの家計簿 DataFrame から作ったか」と組にして覚えておき、
+# 家計簿のキャッシュが別の DataFrame に変わったら作り直す。
+
+def _snapshot_rollups(snap):
+    tables = snap.get('rollups')
+    return tables if tables is not None else rollups.build(snap['df'])
+
+def _remember_rollups(sh, df, tables):
+    cache = _data_cache()
+    with cache['lock']:
+        cache['rollups'][sh.id] = (df, tables)
+
+def _save_kakeibo_snapshot(sh, df, tables, row_count, tail_row, synced_at=None):
+    snapshot.save_snapshot(sh.id, '家計簿', df, row_count, tail_row, synced_at=synced_at, rollups=tables)
+    _remember_rollups(sh, df, tables)
+
+def load_kakeibo_rollups(sh):
+    """家計簿の集計表（rollups.py）を返す。家計簿を読み直していなければ作り直さない"""
+    df = load_kakeibo_data(sh)
+    cache = _data_cache()
+    with cache['lock']:
+        entry = cache['rollups'].get(sh.id)
+    if entry is not None and entry[0] is df:
+        return entry[1]
+    tables = rollups.build(df)
+    _remember_rollups(sh, df, tables)
+    return tables
+
+# 空のシートに初めて書き込むときに付けるヘッダー
+SHEET_HEADERS = {
+    '投資': ['日付', '銘柄', '数量', '支払い金額', 'メモ'],
+    'サブスク': ['サービス名', '金額', 'カテゴリー', '支払日', 'メモ'],
+}
+
+def _updated_start_row(append_response):
+    """values.append のレスポンスから、書き込まれた先頭行の行番号を取り出す"""
+    updated_range = append_response.get('updates', {}).get('updatedRange', '')
+    m = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(m.group(1)) if m else None
+
+def _updated_tail_row(append_response):
+    """
+    values.append のレスポンス（includeValuesInResponse 付き）から、書き込まれた最後の行を
+    シートが表示する形（values.get で読んだときと同じ文字列）で取り出す。無ければ None
+    """
+    values = append_response.get('updates', {}).get('updatedData', {}).get('values', [])
+    return _pad_row(values[-1]) if values else None
+
+def _sheet_tail(sh, sheet_name):
+    """
+    シートの最終行（空でない最後の行）の行番号と、その時点のシートの内容を返す（空のシートは 0）。
+    家計簿はスナップショットの最終行から下だけを読んで確かめ、合わなければ全件を読み直す。
+    """
+    if sheet_name == '家計簿':
+        df = _fetch_kakeibo_data(sh)
+        snap = snapshot.load_snapshot(sh.id, '家計簿')
+        return (snap['row_count'] if snap is not None else 0), df
+    # A:E はデータの途中の空行も空のリストとして返すので、件数がそのまま最終行の行番号になる
+    values = _get_values(sh, f"'{sheet_name}'!A:E")
+    parser = {'投資': _parse_investment_rows, 'サブスク': _parse_subscription_rows}.get(sheet_name)
+    return len(values), (parser(values) if parser is not None else None)
+
+def _append_rows(sh, rows_by_sheet):
+    """
+    複数行をシート末尾にまとめて追記する。
+    values.append は指定した範囲を含む「表」（空行で区切られた連続した行）の直後に書き込むため、
+    A1:E1 を指定するとデータの途中に空行があるシートでは、その空行の位置に行が挿入されてしまう。
+    そこで確かめた最終行（_sheet_tail）を範囲に指定し、必ずシートの最後の行の下に書き込む。
+    家計簿はスナップショットの最終行から下を読むだけなので、行数に関係なく小さな読み込み1回と追記1回で済む。
+    書き込まれた行が最終行の直後でなかった（読み込みと追記の間に外部で行が増減した）場合は、
+    キャッシュとスナップショットを捨ててシートから読み直させる。
+    書き込み中もキャッシュは捨てずに残し、画面側は追記前のデータ（と未送信の行）を表示し続ける
+    （ロックを待たせないため）。書き込んだ行は終わってからキャッシュに直接反映し、
+    次の画面描画でシートを読み直さずに済むようにする。
+    送信が通信エラー・5xx で失敗した場合や、書き込めた後の処理で失敗した場合は
+    write_queue.PossiblyWritten に送信直前の最終行を添えて投げ、再送時に確かめられるようにする。
+    rows_by_sheet: {シート名: [[A, B, C, D, E], ...]}
+    戻り値: {シート名: 追記した行の DataFrame（シート上の行番号から決まる No 付き）}
+    """
+    appended = {}
+    for name, rows in rows_by_sheet.items():
+        if not rows:
+            continue
+        with _sheet_lock(sh):
+            last_row, current = _sheet_tail(sh, name)
+            version = get_data_version(sh, name)
+            try:
+                res = _write(
+                    sh, sh.values_append,
+                    f"'{name}'!A{last_row}:E{last_row}" if last_row else f"'{name}'!A1:E1",
+                    # 書き込んだ値を表示される形で返してもらい、スナップショットの最終行として使う
+                    params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS', 'includeValuesInResponse': True},
+                    body={'values': rows},
+                    idempotent=False,
+                )
+            except Exception as e:
+                if sheets_client.is_rejected(e):
+                    raise
+                raise write_queue.PossiblyWritten(last_row, e) from e
+            start_row = _updated_start_row(res)
+            if start_row is None or start_row != last_row + 1:
+                # 確かめた最終行の直後に書かれなかった: 手元の行番号は当てにならないので読み直させる
+                _invalidate(sh, name)
+                if name == '家計簿':
+                    snapshot.drop_snapshot(sh.id, '家計簿')
+                continue
+            try:
+                start_row = _add_header(sh, name, start_row, rows)
+                if get_data_version(sh, name) != version:
+                    # 書き込みの前に外部で編集されていた: 手元のデータは使わずに読み直させる
+                    current = None
+                appended[name] = _apply_appended_rows(sh, name, start_row, rows, current, _updated_tail_row(res))
+            except Exception as e:
+                # 行は書き込めている: 再送時に last_row の直下で見つけて、二重に追記しないようにする
+                raise write_queue.PossiblyWritten(last_row, e) from e
+    return appended
+
+def _add_header(sh, sheet_name, start_row, rows):
+    """空のシートに書き込んだ場合（1行目から書かれた場合）はヘッダーを付けて書き直し、行の新しい先頭行を返す"""
+    if start_row != 1 or sheet_name not in SHEET_HEADERS:
+        return start_row
+    _write(
+        sh, sh.values_update,
+        f"'{sheet_name}'!A1",
+        params={'valueInputOption': 'RAW'},
+        body={'values': [SHEET_HEADERS[sheet_name]] + rows},
+    )
+    return 2
+
+def _apply_appended_rows(sh, sheet_name, start_row, rows, cached, tail_row=None):
+    """
+    追記した行を DataFrame にしてキャッシュ（家計簿はスナップショットも）の末尾に足す。
+    手元のデータが追記前のシートと一致していると確認できない場合は、キャッシュを捨てて読み直させる。
+    tail_row は書き込んだ最後の行をシートが表示する形にしたもの（無ければシートから読む）。
+    スナップショットの最終行は、次回の差分読み込みで values.get の結果と比べるので、
+    書き込んだ Python の値（金額が int など）ではなくこちらを保存する。
+    """
+    if sheet_name == '家計簿':
+        new_df = _parse_kakeibo_rows(rows, start_no=start_row - 1)
+        snap = snapshot.load_snapshot(sh.id, '家計簿')
+        # スナップショットの最終行のすぐ下に書かれた場合だけ、そのまま繋げられる
+        if snap is not None and snap['row_count'] == start_row - 1:
+            last_row = start_row - 1 + len(rows)
+            if tail_row is None:
+                tail_row = _pad_row((_get_values(sh, f"'家計簿'!A{last_row}:E{last_row}") or [[]])[0])
+            df = new_df if snap['df'].empty else decoder.compact_ledger(pd.concat([snap['df'], new_df], ignore_index=True))
+            tables = rollups.add_rows(_snapshot_rollups(snap), new_df)
+            _save_kakeibo_snapshot(sh, df, tables, last_row, tail_row, synced_at=snap['synced_at'])
+            _replace_cached(sh, '家計簿', df)
+        else:
+            _invalidate(sh, '家計簿')
+        return new_df
+
+    parser = {'投資': _parse_investment_rows, 'サブスク': _parse_subscription_rows}.get(sheet_name)
+    if parser is None:
+        _invalidate(sh, sheet_name)
+        return pd.DataFrame(rows)
+    new_df = parser([SHEET_HEADERS[sheet_name]] + rows)
+    if 'No' in new_df.columns:
+        new_df['No'] = start_row + new_df.index
+    if cached is not None:
+        df = new_df if cached.empty else pd.concat([cached, new_df], ignore_index=True)
+        _replace_cached(sh, sheet_name, df)
+    else:
+        _invalidate(sh, sheet_name)
+    return new_df
+
+# ==========================================
+# ★ 書き込みの待ち行列
+# ==========================================
+# 追記はまずローカルの待ち行列に保存して即座に返し、
+# バックグラウンドで _append_rows を使ってシートへ送る（write_queue.py）。
+# 削除・メモの更新は行番号や全文の上書きが絡むため、これまで通りその場で書き込む。
+
+def _normalize_cell(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def _find_appended_rows(sh, sheet_name, rows, after_row):
+    """
+    前回の送信がエラーでも実際には書き込まれていた場合に、二重に追記しないための確認。
+    after_row は前回の送信直前に確かめたシートの最終行。_append_rows はその直下に書き込むので、
+    after_row + 1 行目からの行が rows と一致すれば after_row + 1 を返す。
+    直下が空（書き込まれていない）か別の行がある場合は None を返し、もう一度追記させる。
+    （シートの末尾と見比べるだけでは、同じ内容の行（毎日の同じ運賃など）を書き込み済みと取り違える）
+    """
+    candidates = [after_row]
+    if after_row == 0 and sheet_name in SHEET_HEADERS:
+        # 空のシートに書き込んだ後、ヘッダーを付け終えていれば行は2行目から下にある
+        candidates.append(1)
+    normalize = lambda row: [_normalize_cell(v) for v in _pad_row(row)]
+    for after in candidates:
+        res = sheets_client.read(
+            sh.values_get, f"'{sheet_name}'!A{after + 1}:E{after + len(rows)}",
+            params={'valueRenderOption': 'UNFORMATTED_VALUE'},
+        )
+        values = res.get('values', [])
+        if len(values) == len(rows) and all(normalize(a) == normalize(b) for a, b in zip(values, rows)):
+            return after + 1
+    return None
+
+def _flush_queued_rows(sh, sheet_name, rows, sent_after_row):
+    with _sheet_lock(sh):
+        if sent_after_row is not None:
+            start_row = _find_appended_rows(sh, sheet_name, rows, sent_after_row)
+            if start_row is not None:
+                start_row = _add_header(sh, sheet_name, start_row, rows)
+                # 前回の送信の後に読み直したキャッシュには既に含まれているかもしれないので、足さずに読み直させる
+                _apply_appended_rows(sh, sheet_name, start_row, rows, None)
+                return
+        _append_rows(sh, {sheet_name: rows})
+
+@st.cache_resource
+def _write_queue():
+    return write_queue.WriteQueue(_flush_queued_rows)
+
+def start_write_queue(sh):
+    """前回までに送り切れなかった行があれば、バックグラウンドで送り始める"""
+    _write_queue().attach(sh)
+
+def _submit_rows(sh, rows_by_sheet):
+    _write_queue().enqueue(sh, rows_by_sheet)
+
+def pending_rows(sh, sheet_name):
+    """まだシートへ送れていない行（[[A, B, C, D, E], ...]）"""
+    return [item['row'] for item in _write_queue().pending(sh.id, sheet_name)]
+
+def pending_kakeibo_data(sh):
+    """未送信の家計簿の行を DataFrame で返す（シートの行番号が決まっていないので No は無い）"""
+    return _parse_kakeibo_rows(pending_rows(sh, '家計簿')).drop(columns='No')
+
+def write_queue_error():
+    """直近の送信エラー（送信できていれば None）"""
+    return _write_queue().last_error()
+
+def _kakeibo_row(date, balance_type, category, amount, memo):
+    return [str(date), balance_type, category, amount, memo]
+
+def add_entries(sh, entries):
+    """家計簿に複数行をまとめて追加する（待ち行列経由）。entries: [(日付, 区分, カテゴリー, 金額, メモ), ...]"""
+    _submit_rows(sh, {'家計簿': [_kakeibo_row(*entry) for entry in entries]})
+
 def add_entry(sh, date, balance_type, category, amount, memo):
-    ws = sh.worksheet('家計簿')
-    col_a_values = ws.col_values(1)
-    next_row = len(col_a_values) + 1
-    row_data = [[str(date), balance_type, category, amount, memo]]
-    ws.update(range_name=f"A{next_row}:E{next_row}", values=row_data)
+    add_entries(sh, [(date, balance_type, category, amount, memo)])
 
-def delete_entry(sh, row_index):
-    ws = sh.worksheet('家計簿')
-    current_data = ws.get('A:E')
-    target_list_index = int(row_index) - 1
-    if 0 <= target_list_index < len(current_data):
-        current_data.pop(target_list_index)
-        ws.batch_clear(['A:E'])
-        if current_data:
-            ws.update(range_name='A1', values=current_data)
-
-def delete_callback():
-    target_no = st.session_state.get("delete_input_no")
-    if target_no:
+def _delete_rows(sh, sheet_name, row_indexes):
+    """
+    指定したシート行（1始まり、ヘッダーは除く）だけを削除する。
+    下の行から順に deleteDimension を並べ、1回の batchUpdate で送る。
+    実際に削除した行番号を昇順で返す。
+    """
+    ws = sheets_client.read(sh.worksheet, sheet_name)
+    targets = sorted({int(r) for r in row_indexes if 2 <= int(r) <= ws.row_count}, reverse=True)
+    if not targets:
+        return ws, []
+    requests = [
+        {'deleteDimension': {'range': {'sheetId': ws.id, 'dimension': 'ROWS', 'startIndex': r - 1, 'endIndex': r}}}
+        for r in targets
+    ]
+    try:
+        _write(sh, sh.batch_update, {'requests': requests}, idempotent=False)
+    finally:
+        _invalidate(sh, sheet_name)
+    return ws, targets[::-1]
+
+def _apply_kakeibo_deletion(sh, ws, deleted_rows):
+    """削除した行をスナップショットにも反映し、次回の読み込みで全件取得しなくて済むようにする"""
+    snap = snapshot.load_snapshot(sh.id, '家計簿')
+    if snap is None:
+        return
+    row_count = snap['row_count']
+    deleted_nos = np.array([r - 1 for r in deleted_rows if r <= row_count])
+    if len(deleted_nos) == 0:
+        return
+    df = snap['df']
+    deleted = df['No'].isin(deleted_nos)
+    tables = rollups.remove_rows(_snapshot_rollups(snap), df[deleted])
+    df = df[~deleted].copy()
+    # 削除した行より下の行は、その分だけ No が繰り上がる
+    df['No'] = (df['No'] - np.searchsorted(deleted_nos, df['No'].to_numpy())).astype(df['No'].dtype)
+    new_count = row_count - len(deleted_nos)
+    tail_row = snap['tail_row']
+    if deleted_nos[-1] == row_count - 1:
+        # 最終行を消した場合は、新しい最終行だけを取り直す
         try:
-            real_row_index = int(target_no) + 1
-            target_sheet_name = st.session_state.get("target_sheet")
-            if not target_sheet_name:
-                raise Exception("ログイン情報が見つかりません")
-            sh = get_worksheet(target_sheet_name)
-            delete_entry(sh, real_row_index)
-            st.session_state["delete_input_no"] = None
-            st.session_state["del_confirm_ckeck"] = False
-            st.session_state["menu_reset_id"] += 1
-            st.session_state["delete_msg"] = f"No.{target_no} を削除しました！"
-        except Exception as e:
-            st.session_state["delete_msg"] = f"削除エラー: {e}"
+            tail_row = _pad_row((sheets_client.read(ws.get, f"A{new_count}:E{new_count}") or [[]])[0])
+        except Exception:
+            snapshot.drop_snapshot(sh.id, '家計簿')
+            return
+    df = df.reset_index(drop=True)
+    _save_kakeibo_snapshot(sh, df, tables, new_count, tail_row, synced_at=snap['synced_at'])
+    _replace_cached(sh, '家計簿', df)
 
-def load_investment_data(sh):
-    cols = ['日付','銘柄','数量','支払金額','メモ']
-    try:
-        ws = sh.worksheet('投資')
-        raw_data = ws.get('A:E')
-    except Exception:
-        return pd.DataFrame(columns=cols)
+def delete_entries(sh, nos):
+    """家計簿から複数の No をまとめて削除する"""
+    with _sheet_lock(sh):
+        ws, deleted_rows = _delete_rows(sh, '家計簿', [int(no) + 1 for no in nos])
+        if deleted_rows:
+            _apply_kakeibo_deletion(sh, ws, deleted_rows)
+
+def delete_entry(sh, row_index):
+    delete_entries(sh, [int(row_index) - 1])
+
+INVESTMENT_COLUMNS = ['日付','銘柄','数量','支払金額','メモ']
+
+def _parse_investment_rows(raw_data):
+    cols = INVESTMENT_COLUMNS
     if not raw_data or len(raw_data) < 2:
         return pd.DataFrame(columns=cols)
-        
-    data_rows = raw_data[1:]
-    clean_data = []
-    for row in data_rows:
-        padded_row = (row + [""] * 5)[:5]
-        clean_data.append(padded_row)
-    df = pd.DataFrame(clean_data, columns=cols)
-    df['数量'] = pd.to_numeric(df['数量'], errors='coerce').fillna(0.0)
+    df = decoder.to_frame(raw_data[1:], cols)
+    df['数量'] = decoder.parse_floats(df['数量'])
     return df
 
+def load_investment_data(sh):
+    return _cached_load(sh, '投資', _fetch_investment_data, _empty_investment)
+
+def _fetch_investment_data(sh):
+    return _parse_investment_rows(_get_values(sh, "'投資'!A:E"))
+
+def _empty_investment():
+    return pd.DataFrame(columns=INVESTMENT_COLUMNS)
+
 def add_investment_data(sh, date, investment_name, investment_amount, pay_amount, memo):
-    ws = sh.worksheet('投資')
-    col_a_values = ws.col_values(1)
-    next_row = len(col_a_values) + 1
-    if next_row == 1:
-        ws.update(range_name='A1:E1', values=[['日付', '銘柄', '数量', '支払い金額', 'メモ']])
-        next_row = 2
-    row_data = [[str(date), investment_name, investment_amount, pay_amount, memo]]
-    ws.update(range_name=f"A{next_row}:E{next_row}", values=row_data)
+    row_data = [str(date), investment_name, investment_amount, pay_amount, memo]
+    _submit_rows(sh, {'投資': [row_data]})
 
-def load_subscription_data(sh):
-    cols = ['サービス名', '金額', 'カテゴリー', '支払日', 'メモ']
-    try:
-        ws = sh.worksheet('サブスク')
-        raw_data = ws.get('A:E')
-    except Exception:
-        return pd.DataFrame(columns=cols)
+def add_investment_purchase(sh, date, investment_name, investment_amount, pay_amount, memo):
+    """投資の購入を、家計簿（支出/投資費）と投資シートへ同時に書き込む"""
+    _submit_rows(sh, {
+        '家計簿': [_kakeibo_row(date, '支出', '投資費', pay_amount, memo)],
+        '投資': [[str(date), investment_name, investment_amount, pay_amount, memo]],
+    })
+
+SUBSCRIPTION_COLUMNS = ['サービス名', '金額', 'カテゴリー', '支払日', 'メモ']
+
+def _parse_subscription_rows(raw_data):
+    cols = SUBSCRIPTION_COLUMNS
     if not raw_data or len(raw_data) < 2:
         return pd.DataFrame(columns=cols)
-        
-    data_rows = raw_data[1:]
-    clean_data = []
-    for row in data_rows:
-        padded = (row + [""] * 5)[:5]
-        clean_data.append(padded)
-    df = pd.DataFrame(clean_data, columns=cols)
-    df = df[df['サービス名'].astype(str).str.strip() != ""]
+    df = decoder.to_frame(raw_data[1:], cols)
+    # No はシートの行番号（削除に使うので、空行を除く前の位置から決める）
+    df.insert(0, 'No', df.index + 2)
+    df = df[df['サービス名'].str.strip() != ""].copy()
     if df.empty:
         return pd.DataFrame(columns=cols)
-    df['金額'] = pd.to_numeric(df['金額'], errors='coerce').fillna(0).astype(int)
-    df['支払日'] = pd.to_numeric(df['支払日'], errors='coerce').fillna(1).astype(int)
-    df.insert(0, 'No', range(2, 2 + len(df)))
+    df['金額'] = decoder.parse_ints(df['金額'])
+    df['支払日'] = decoder.parse_ints(df['支払日'], default=1)
     return df
 
+def load_subscription_data(sh):
+    return _cached_load(sh, 'サブスク', _fetch_subscription_data, _empty_subscription)
+
+def _fetch_subscription_data(sh):
+    return _parse_subscription_rows(_get_values(sh, "'サブスク'!A:E"))
+
+def _empty_subscription():
+    return pd.DataFrame(columns=SUBSCRIPTION_COLUMNS)
+
 def add_subscription(sh, service_name, amount, category, pay_day, memo):
-    ws = sh.worksheet('サブスク')
-    col_a_values = ws.col_values(1)
-    next_row = len(col_a_values) + 1
-    if next_row == 1:
-        ws.update(range_name='A1:E1', values=[['サービス名', '金額', 'カテゴリー', '支払日', 'メモ']])
-        next_row = 2
-    row_data = [[service_name, amount, category, pay_day, memo]]
-    ws.update(range_name=f'A{next_row}:E{next_row}', values=row_data)
+    row_data = [service_name, amount, category, pay_day, memo]
+    _submit_rows(sh, {'サブスク': [row_data]})
 
 def delete_subscription(sh, row_index):
-    ws = sh.worksheet('サブスク')
-    current_data = ws.get('A:E')
-    target_list_index = int(row_index) - 1
-    if 0 <= target_list_index < len(current_data):
-        current_data.pop(target_list_index)
-        ws.batch_clear(['A:E'])
-        if current_data:
-            ws.update(range_name='A1', values=current_data)
-
-def auto_add_subscriptions(sh, df_kakeibo):
-    try:
-        df_sub = load_subscription_data(sh)
-    except Exception:
-        return 0
+    with _sheet_lock(sh):
+        _delete_rows(sh, 'サブスク', [row_index])
+
+def due_subscription_entries(df_kakeibo, df_sub, pending_memos=()):
+    """
+    今月分がまだ家計簿に無いサブスクの行 [(日付, 区分, カテゴリー, 金額, メモ), ...] を返す。
+    pending_memos は未送信の行のメモ（追加済みとして扱う）。
+    """
     if df_sub.empty:
-        return 0
+        return []
     now = pd.Timestamp.now(tz='Asia/Tokyo')
     year = now.year
     month = now.month
-    added_count = 0
+    new_entries = []
     for _, row in df_sub.iterrows():
         service_name = str(row['サービス名']).strip()
         if not service_name:
@@ -185,31 +661,51 @@ def auto_add_subscriptions(sh, df_kakeibo):
             already_added = df_kakeibo['メモ'].astype(str).str.contains(
                 identifier, regex=False
             ).any()
+        already_added = already_added or any(identifier in memo for memo in pending_memos)
         if not already_added:
             last_day = calendar.monthrange(year, month)[1]
             pay_day = min(int(row['支払日']), last_day)
             pay_date = pd.Timestamp(year=year, month=month, day=pay_day).date()
             memo_with_id = f"{row['メモ']} {identifier}".strip()
-            add_entry(sh, pay_date, '支出', row['カテゴリー'], int(row['金額']), memo_with_id)
-            added_count += 1
-    return added_count
+            new_entries.append((pay_date, '支出', row['カテゴリー'], int(row['金額']), memo_with_id))
+    return new_entries
+
+def auto_add_subscriptions(sh, df_kakeibo, df_sub=None):
+    if df_sub is None:
+        try:
+            df_sub = load_subscription_data(sh)
+        except Exception:
+            return 0
+    # 待ち行列にある未送信の行も追加済みとして扱う
+    pending_memos = [str(row[4]) for row in pending_rows(sh, '家計簿') if len(row) > 4]
+    new_entries = due_subscription_entries(df_kakeibo, df_sub, pending_memos)
+    if new_entries:
+        add_entries(sh, new_entries)
+    return len(new_entries)
+
+def _parse_memo_rows(raw_data):
+    return raw_data[0][0] if raw_data and raw_data[0] else ""
+
+def _fetch_anything_memo(sh):
+    return _parse_memo_rows(_get_values(sh, "'なんでもメモ'!A2"))
 
 def get_anything_memo(sh):
     try:
-        ws = sh.worksheet('なんでもメモ')
-        current_memo = ws.acell('A2').value
-        if current_memo is None:
-            current_memo = ""
+        current_memo = _fetch_anything_memo(sh)
     except Exception:
         current_memo = ""
     return current_memo
 
 def update_anything_memo(sh, text):
     try:
-        ws = sh.worksheet('なんでもメモ')
-        if str(ws.acell('A1').value) != 'なんでもメモ':
-            ws.update_acell('A1', 'なんでもメモ')
-        ws.update_acell('A2', text)
+        # 見出し(A1)と本文(A2)を1回の書き込みで更新する
+        _write(
+            sh, sh.values_update,
+            "'なんでもメモ'!A1:A2",
+            params={'valueInputOption': 'RAW'},
+            body={'values': [['なんでもメモ'], [text]]},
+        )
+        _replace_cached(sh, 'なんでもメモ', text)
     except Exception:
         pass
 
@@ -225,38 +721,213 @@ def color_coding(val):
 # ==========================================
 def save_price_cache(sh, prices_dict, timestamp):
     """API取得が成功したときに、時刻と価格をスプレッドシートに保存する"""
-    try:
-        ws = sh.worksheet('価格キャッシュ')
-    except Exception:
-        # シートが無ければ作成
-        ws = sh.add_worksheet(title='価格キャッシュ', rows="100", cols="3")
-    
     data = []
     for symbol, price in prices_dict.items():
         data.append([str(timestamp), symbol, price])
-    
-    if data:
-        ws.clear()
-        ws.update(range_name='A1', values=[['取得日時', '銘柄', '価格']] + data)
+    if not data:
+        return
+
+    if '価格キャッシュ' not in _sheet_titles(sh, sh.id):
+        # シートが無ければ作成
+        _write(sh, sh.add_worksheet, title='価格キャッシュ', rows="100", cols="3")
+        _sheet_titles.clear()
+
+    _write(sh, sh.values_clear, "'価格キャッシュ'!A:C")
+    _write(
+        sh, sh.values_update,
+        "'価格キャッシュ'!A1",
+        params={'valueInputOption': 'RAW'},
+        body={'values': [['取得日時', '銘柄', '価格']] + data},
+    )
+    _replace_cached(sh, '価格キャッシュ', (dict(prices_dict), str(timestamp)))
+
+# ==========================================
+# ★ 価格キャッシュの保存（価格が変わったときだけ、描画とは別スレッドで）
+# ==========================================
+@st.cache_resource
+def _price_cache_writer():
+    return {
+        'lock': threading.Lock(),
+        'executor': ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-cache-writer'),
+        'saved': {},
+        'pending': {},
+    }
+
+def _parse_cache_time(timestamp):
+    """価格キャッシュの取得日時（JST の文字列）を time.time() の値にする。読めなければ 0"""
+    try:
+        jst = datetime.timezone(datetime.timedelta(hours=+9), 'JST')
+        return datetime.datetime.strptime(str(timestamp), "%Y/%m/%d %H:%M:%S").replace(tzinfo=jst).timestamp()
+    except ValueError:
+        return 0
+
+def _prices_changed(old_prices, new_prices, threshold):
+    if set(old_prices) != set(new_prices):
+        return True
+    return any(abs(new_prices[sym] - old_prices[sym]) > abs(old_prices[sym]) * threshold for sym in new_prices)
+
+def persist_price_cache(sh, prices_dict, timestamp, saved_cache=None):
+    """
+    価格キャッシュシートへの保存を予約する（描画はこの書き込みを待たない）。
+    前回保存した価格から PRICE_CACHE_CHANGE_THRESHOLD 以上変わった銘柄があるか、
+    前回の保存から PRICE_CACHE_SAVE_INTERVAL_SEC 以上経っている場合だけ書き込む。
+    saved_cache はシートから読み込んだ (価格の辞書, 取得日時) で、起動直後の比較に使う。
+    保存を予約したら True を返す。
+    """
+    if not prices_dict:
+        return False
+    writer = _price_cache_writer()
+    now = time.time()
+    with writer['lock']:
+        saved = writer['saved'].get(sh.id)
+        if saved is None and saved_cache is not None and saved_cache[0]:
+            saved = {'prices': saved_cache[0], 'saved_at': _parse_cache_time(saved_cache[1])}
+        if (saved is not None
+                and now - saved['saved_at'] < c.PRICE_CACHE_SAVE_INTERVAL_SEC
+                and not _prices_changed(saved['prices'], prices_dict, c.PRICE_CACHE_CHANGE_THRESHOLD)):
+            return False
+        writer['saved'][sh.id] = {'prices': dict(prices_dict), 'saved_at': now}
+        # 書き込み待ちが既にあれば中身だけ最新にする（同じシートへの書き込みは1つにまとめる）
+        already_pending = sh.id in writer['pending']
+        writer['pending'][sh.id] = (sh, dict(prices_dict), str(timestamp))
+    if not already_pending:
+        writer['executor'].submit(_flush_price_cache, sh.id)
+    return True
+
+def _flush_price_cache(spreadsheet_id):
+    writer = _price_cache_writer()
+    with writer['lock']:
+        sh, prices_dict, timestamp = writer['pending'].pop(spreadsheet_id)
+    try:
+        save_price_cache(sh, prices_dict, timestamp)
+    except Exception:
+        # 失敗したら、次の描画で改めて保存させる
+        with writer['lock']:
+            writer['saved'].pop(spreadsheet_id, None)
+
+def _parse_price_cache_rows(raw_data):
+    if len(raw_data) < 2:
+        return {}, None
+
+    prices_dict = {}
+    timestamp = raw_data[1][0] # A2のセルに記録されている時刻
+    for row in raw_data[1:]:
+        if len(row) >= 3:
+            symbol = row[1]
+            try:
+                price = float(row[2])
+                prices_dict[symbol] = price
+            except ValueError:
+                pass
+    return prices_dict, timestamp
+
+def _fetch_price_cache(sh):
+    return _parse_price_cache_rows(_get_values(sh, "'価格キャッシュ'!A:C"))
 
 def load_price_cache(sh):
     """API取得が失敗したときに、スプレッドシートのキャッシュを読み込む"""
     try:
-        ws = sh.worksheet('価格キャッシュ')
-        raw_data = ws.get_all_values()
-        if len(raw_data) < 2:
-            return {}, None
-        
-        prices_dict = {}
-        timestamp = raw_data[1][0] # A2のセルに記録されている時刻
-        for row in raw_data[1:]:
-            if len(row) >= 3:
-                symbol = row[1]
-                try:
-                    price = float(row[2])
-                    prices_dict[symbol] = price
-                except ValueError:
-                    pass
-        return prices_dict, timestamp
+        return _fetch_price_cache(sh)
     except Exception:
-        return {}, None
\ No newline at end of file
+        return {}, None
+
+# ==========================================
+# ★ 画面描画に必要なシートの一括読み込み
+# ==========================================
+@st.cache_data(ttl=600, show_spinner=False)
+def _sheet_titles(_sh, spreadsheet_id):
+    """スプレッドシート内のシート名一覧（存在しないシートを batchGet に含めないために使う）"""
+    return [ws.title for ws in sheets_client.read(_sh.worksheets, key=('worksheets', spreadsheet_id))]
+
+# 一括読み込みの対象: シート名 → (読む範囲, 生データのパース関数, 個別に読み込む関数, 読めなかったときの値)
+# 個別に読み込む関数は通信エラーを投げる（読めなかった値はキャッシュしない）
+ALL_DATA_SHEETS = {
+    '家計簿': (None, None, _fetch_kakeibo_data, _empty_kakeibo),
+    '投資': ('A:E', _parse_investment_rows, _fetch_investment_data, _empty_investment),
+    'サブスク': ('A:E', _parse_subscription_rows, _fetch_subscription_data, _empty_subscription),
+    '価格キャッシュ': ('A:C', _parse_price_cache_rows, _fetch_price_cache, lambda: ({}, None)),
+    'なんでもメモ': ('A2', _parse_memo_rows, _fetch_anything_memo, lambda: ""),
+}
+
+def _kakeibo_from_batch(sh, snap, values, version):
+    """
+    一括読み込みした家計簿の範囲から DataFrame を作る（_sheet_lock を持って呼ぶ）。
+    読み込み中にこのアプリから書き込まれていた場合は、読んだ範囲を使わずに最新のスナップショットから読み直す。
+    戻り値: (DataFrame, キャッシュに保存するときのバージョン)
+    """
+    current = get_data_version(sh, '家計簿')
+    if current != version:
+        return _fetch_kakeibo_data(sh), current
+    if '家計簿' not in values:
+        return _empty_kakeibo(), version
+    if snap is None:
+        return _build_kakeibo_full(sh, values['家計簿']), version
+    df = _apply_kakeibo_tail(sh, snap, values['家計簿'])
+    if df is None:
+        # 末尾が一致しない（削除・編集された）ときだけ全件を取り直す
+        df = _load_kakeibo_full(sh)
+    return df, version
+
+def load_all_data(sh):
+    """
+    家計簿・投資・サブスク・価格キャッシュ・なんでもメモを読み込む。
+    キャッシュが有効なシートは通信せずに返し、それ以外は1回の values.batchGet でまとめて取得する。
+    戻り値はシート名をキーにした辞書（価格キャッシュは (価格の辞書, 取得日時)、なんでもメモは文字列）。
+    """
+    refresh_if_changed(sh)
+
+    result = {}
+    versions = {}
+    for name in ALL_DATA_SHEETS:
+        hit, value = _cache_get(sh, name)
+        if hit:
+            result[name] = value
+        else:
+            versions[name] = get_data_version(sh, name)
+    if not versions:
+        return result
+
+    try:
+        titles = _sheet_titles(sh, sh.id)
+    except Exception:
+        # シート名の一覧が取れなくても「シートが無い」とはみなさず、全ての範囲を読みに行く
+        # （本当に無いシートがあれば batchGet が失敗し、下の個別読み込みに切り替わる）
+        titles = None
+
+    def exists(name):
+        return titles is None or name in titles
+
+    snap = snapshot.load_snapshot(sh.id, '家計簿') if '家計簿' in versions and exists('家計簿') else None
+    ranges = {}
+    for name in versions:
+        if not exists(name):
+            continue
+        cells = ALL_DATA_SHEETS[name][0]
+        ranges[name] = _kakeibo_range(snap) if name == '家計簿' else f"'{name}'!{cells}"
+
+    values = {}
+    if ranges:
+        try:
+            res = sheets_client.read(sh.values_batch_get, list(ranges.values()), key=('values_batch_get', sh.id, tuple(ranges.values())))
+            values = {name: vr.get('values', []) for name, vr in zip(ranges, res.get('valueRanges', []))}
+        except Exception:
+            # シート名が変わった等で失敗した場合は、一覧を取り直して個別に読み込む
+            _sheet_titles.clear()
+            for name, version in versions.items():
+                _, _, fetch, default = ALL_DATA_SHEETS[name]
+                result[name] = _cached_load(sh, name, fetch, default)
+            return result
+
+    for name, version in versions.items():
+        if name == '家計簿':
+            try:
+                with _sheet_lock(sh):
+                    value, version = _kakeibo_from_batch(sh, snap, values, version)
+            except Exception:
+                result[name] = _empty_kakeibo()
+                continue
+        else:
+            value = ALL_DATA_SHEETS[name][1](values.get(name, []))
+        _cache_put(sh, name, version, value)
+        result[name] = value
+    return result
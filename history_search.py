@@ -0,0 +1,113 @@
+import threading
+import unicodedata
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 入力履歴の検索（Streamlit に依存しない計算部分）
+# ==========================================
+# 期間・カテゴリー・メモの部分一致で家計簿全体を絞り込み、表示するページの行だけを返す。
+# メモの検索には 2文字ずつ区切った索引（bigram）を使う。日本語は単語の区切りが無いので、
+# 「検索語の 2文字の組を全て含むメモ」を索引で集めてから、本当に含むかを確かめる。
+# 索引はメモの文字列（重複を除いたもの）ごとに作り、家計簿が変わったときは
+# まだ索引に無いメモだけを追加する。
+
+# 1ページに表示する行数
+PAGE_SIZE = 50
+
+def normalize(text):
+    """全角・半角や大文字・小文字の違いを無視して比べられるようにする"""
+    return unicodedata.normalize('NFKC', str(text)).lower()
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _unique_values(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.categories
+    return pd.Index(values.astype(str).unique())
+
+def _isin_mask(values, matched):
+    """値が matched のどれかと一致する行の真偽値の配列"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # category 型は行ごとの文字列ではなく、カテゴリーの番号で比べる
+        codes = values.cat.categories.get_indexer(list(matched))
+        return np.isin(values.cat.codes.to_numpy(), codes[codes >= 0])
+    return values.astype(str).isin(matched).to_numpy()
+
+class MemoIndex:
+    """メモの文字列 → 2文字の組 の索引（削除されたメモは残るが、検索結果には影響しない）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._normalized = {}  # メモ → 正規化したメモ
+        self._postings = defaultdict(set)  # 2文字の組 → その組を含むメモ
+        self._synced = None  # 前回追加したメモの一覧（同じ家計簿なら確認もしない）
+
+    def sync(self, memos):
+        """家計簿のメモ列を渡し、まだ索引に無いメモだけを追加する"""
+        unique = _unique_values(memos)
+        with self._lock:
+            if unique is self._synced:
+                return
+            self._synced = unique
+            new_memos = set(unique.tolist()) - self._normalized.keys()
+            for memo in new_memos:
+                text = normalize(memo)
+                self._normalized[memo] = text
+                for gram in _bigrams(text):
+                    self._postings[gram].add(memo)
+
+    def matching(self, query):
+        """query を含むメモの集合を返す"""
+        query = normalize(query)
+        with self._lock:
+            grams = _bigrams(query)
+            if not grams:
+                # 1文字の検索は索引を使わず、重複を除いたメモを直接調べる
+                candidates = self._normalized
+            else:
+                postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set.intersection(*postings)
+            return {memo for memo in candidates if query in self._normalized[memo]}
+
+def search(df, index=None, start=None, end=None, categories=None, memo=""):
+    """
+    条件に合う行の位置（df の行番号）を新しい順に返す。
+    start / end は日付（両端を含む、None なら制限なし）、categories はカテゴリーのリスト（空なら全て）。
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None or end is not None:
+        dates = df['日付'].to_numpy(dtype='datetime64[ns]')
+        if start is not None:
+            mask &= dates >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            mask &= dates < np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1))
+    if categories:
+        mask &= _isin_mask(df['カテゴリー'], categories)
+    if memo:
+        if index is None:
+            index = MemoIndex()
+            index.sync(df['メモ'])
+        mask &= _isin_mask(df['メモ'], index.matching(memo))
+    return np.flatnonzero(mask)[::-1]
+
+def page_count(positions, page_size=PAGE_SIZE):
+    return max(1, -(-len(positions) // page_size))
+
+def get_page(df, positions, page, page_size=PAGE_SIZE):
+    """search の結果のうち page ページ目（1始まり）の行だけを取り出す"""
+    start = (page - 1) * page_size
+    return df.iloc[positions[start:start + page_size]]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_memo_index(store_key, memos):
+    """保存先ごとのメモの索引を返す（家計簿に増えたメモはここで追加される）"""
+    with _indexes_lock:
+        index = _indexes.get(store_key)
+        if index is None:
+            index = _indexes[store_key] = MemoIndex()
+    index.sync(memos)
+    return index
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import pandas as pd
+import const as c
+import decoder
+
+# ==========================================
+# 価格の履歴（追記のみのローカル時系列ストア）
+# ==========================================
+# 価格キャッシュシートは最新の1件しか持たないため、取得した価格を
+# 銘柄 × 取得時刻ごとに SQLite へ追記していき、投資資産の推移を計算できるようにする。
+
+DB_PATH = os.path.join(c.LOCAL_DATA_DIR, 'price_history.sqlite3')
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS prices ("
+        " symbol TEXT NOT NULL,"
+        " ts INTEGER NOT NULL,"
+        " price REAL NOT NULL,"
+        " PRIMARY KEY (symbol, ts)"
+        ") WITHOUT ROWID"
+    )
+    return conn
+
+def record_prices(prices, ts=None):
+    """取得した価格 {銘柄: 円価格} を追記する。0以下の価格（取得失敗）は記録しない"""
+    ts = int(time.time() if ts is None else ts)
+    rows = [(str(sym), ts, float(price)) for sym, price in prices.items() if price and price > 0]
+    if not rows:
+        return
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR IGNORE INTO prices (symbol, ts, price) VALUES (?, ?, ?)", rows)
+
+# 日次の価格の読み込み結果。銘柄の組 → ((最後に記録した時刻, その時刻の行数), DataFrame)
+# 新しい価格が記録されるまで（数分〜数十分おき）は、再描画のたびに集計し直さない
+_daily_memo = {}
+_daily_memo_lock = threading.Lock()
+
+def load_daily_prices(symbols):
+    """
+    銘柄ごとの日次の価格（その日（JST）の最後に記録した価格）を返す。
+    index が日付、列が銘柄の DataFrame。履歴が無ければ空の DataFrame。
+    """
+    symbols = sorted({str(sym) for sym in symbols})
+    if not symbols or not os.path.exists(DB_PATH):
+        return pd.DataFrame()
+    placeholders = ",".join("?" * len(symbols))
+    key = (DB_PATH, tuple(symbols))
+    with closing(_connect()) as conn:
+        # 最後に記録した時刻とその時刻の行数（同じ秒に別々に記録された分も見逃さない）。
+        # 主キー (symbol, ts) の索引だけで求まるので、履歴が増えても軽い
+        latest_ts = conn.execute(
+            f"SELECT MAX(ts) FROM prices WHERE symbol IN ({placeholders})", symbols,
+        ).fetchone()[0]
+        latest = (latest_ts, conn.execute(
+            f"SELECT COUNT(*) FROM prices WHERE symbol IN ({placeholders}) AND ts = ?", symbols + [latest_ts],
+        ).fetchone()[0])
+        with _daily_memo_lock:
+            memo = _daily_memo.get(key)
+        if memo is not None and memo[0] == latest:
+            return memo[1]
+        # 前回の結果があれば、その最終日（JST）の 0時以降の分だけを集計し直す
+        since = None
+        if memo is not None and not memo[1].empty:
+            since = int((memo[1].index.max() - pd.Timedelta(hours=9)).timestamp())
+        # 1日（JST）1行に SQLite 側でまとめる。MAX(ts) と一緒に選んだ price は、
+        # SQLite の仕様でその日の最後の行の値になる
+        df = pd.read_sql_query(
+            "SELECT symbol, date(ts, 'unixepoch', '+9 hours') AS day, price, MAX(ts) AS ts"
+            f" FROM prices WHERE symbol IN ({placeholders})"
+            + (" AND ts >= ?" if since is not None else "")
+            + " GROUP BY symbol, day",
+            conn, params=symbols + ([since] if since is not None else []),
+        )
+    if df.empty:
+        daily = memo[1] if since is not None else pd.DataFrame()
+    else:
+        df['日付'] = pd.to_datetime(df['day'], format='%Y-%m-%d')
+        daily = df.pivot(index='日付', columns='symbol', values='price')
+        if since is not None:
+            daily = daily.combine_first(memo[1])
+        daily = daily.sort_index()
+    with _daily_memo_lock:
+        _daily_memo[key] = (latest, daily)
+    return daily
+
+def compute_portfolio_value(df_investment, daily_prices):
+    """
+    投資シートの購入履歴と日次の価格から、日ごとの投資資産の評価額を計算する。
+    戻り値は ['日付', '評価額'] の DataFrame（価格の履歴がある日以降のみ）。
+    """
+    if df_investment.empty or daily_prices.empty:
+        return pd.DataFrame(columns=['日付', '評価額'])
+
+    trades = df_investment[['日付', '銘柄', '数量']].copy()
+    trades['日付'] = decoder.parse_dates(trades['日付'])
+    trades = trades.dropna(subset=['日付'])
+    trades['銘柄'] = trades['銘柄'].astype(str)
+
+    start = daily_prices.index.min()
+    end = max(daily_prices.index.max(), trades['日付'].max() if not trades.empty else start)
+    days = pd.date_range(start, end, freq='D')
+
+    # 日ごとの保有数量 = その日までの購入数量の累計（購入日が履歴より前の分は初日にまとめる）
+    trades['日付'] = trades['日付'].clip(lower=start)
+    holdings = (
+        trades.pivot_table(index='日付', columns='銘柄', values='数量', aggfunc='sum')
+        .reindex(days, fill_value=0)
+        .fillna(0)
+        .cumsum()
+    )
+    prices = daily_prices.reindex(days).ffill().reindex(columns=holdings.columns)
+    value = (holdings * prices).sum(axis=1, min_count=1).dropna()
+    return pd.DataFrame({'日付': value.index, '評価額': value.to_numpy()})
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 家計簿の集計表（日別・月×カテゴリー別・日×光熱費の種類別）
+# ==========================================
+# ダッシュボードのグラフや支出内訳は、行そのものではなくこの集計表から作る。
+# 行を追加・削除したときは、その行の分だけ足し引きして更新する（全件を集計し直さない）。
+# 家計簿のスナップショットと一緒に保存しておく。
+#
+# 集計表（どれも DataFrame、件数が 0 になった行は消す）:
+#   daily:    index 日付             列 収入・支出・純額（支出以外は足す）・件数・支出件数
+#   category: index (年月, カテゴリー) 列 金額・件数（支出のみ）
+#   utility:  index (日付, 種類)      列 金額・件数（生活費の支出のうち、メモで光熱費と分かるもの）
+
+# メモにこの文字が含まれる生活費を光熱費として扱う（先に一致したものを優先）
+UTILITY_KINDS = ['電気', 'ガス', '水道']
+
+TABLES = {
+    'daily': (['日付'], ['収入', '支出', '純額', '件数', '支出件数']),
+    'category': (['年月', 'カテゴリー'], ['金額', '件数']),
+    'utility': (['日付', '種類'], ['金額', '件数']),
+}
+
+def _empty_table(name):
+    keys, cols = TABLES[name]
+    index = pd.MultiIndex.from_arrays([[] for _ in keys], names=keys) if len(keys) > 1 else pd.DatetimeIndex([], name=keys[0])
+    return pd.DataFrame({col: pd.Series(dtype='int64') for col in cols}, index=index)
+
+def empty():
+    return {name: _empty_table(name) for name in TABLES}
+
+def build(df):
+    """家計簿の行（No・日付・区分・カテゴリー・金額・メモ）から集計表を作る。日付が読めない行は数えない"""
+    rows = df[df['日付'].notna()]
+    if rows.empty:
+        return empty()
+    dates = pd.DatetimeIndex(rows['日付']).normalize()
+    amounts = rows['金額'].to_numpy(dtype='int64')
+    kinds = rows['区分'].astype(str).to_numpy()
+    is_expense = kinds == '支出'
+    is_income = kinds == '収入'
+
+    daily = pd.DataFrame({
+        '日付': dates,
+        '収入': np.where(is_income, amounts, 0),
+        '支出': np.where(is_expense, amounts, 0),
+        '純額': np.where(is_expense, -amounts, amounts),
+        '件数': 1,
+        '支出件数': is_expense.astype('int64'),
+    }).groupby('日付').sum()
+
+    categories = rows['カテゴリー'].astype(str).to_numpy()
+    category = pd.DataFrame({
+        '年月': dates[is_expense].to_period('M').to_timestamp(),
+        'カテゴリー': categories[is_expense],
+        '金額': amounts[is_expense],
+        '件数': 1,
+    }).groupby(['年月', 'カテゴリー']).sum()
+
+    utility_rows = is_expense & (categories == '生活費')
+    memos = rows['メモ'].astype(str)[utility_rows]
+    utility_kind = np.select([memos.str.contains(kind, regex=False) for kind in UTILITY_KINDS], UTILITY_KINDS, default='')
+    known = utility_kind != ''
+    utility = pd.DataFrame({
+        '日付': dates[utility_rows][known],
+        '種類': utility_kind[known],
+        '金額': amounts[utility_rows][known],
+        '件数': 1,
+    }).groupby(['日付', '種類']).sum()
+
+    return {
+        'daily': daily.astype('int64'),
+        'category': category.astype('int64'),
+        'utility': utility.astype('int64'),
+    }
+
+def _combine(tables, delta, sign):
+    result = {}
+    for name in TABLES:
+        base, change = tables[name], delta[name]
+        if change.empty:
+            result[name] = base
+            continue
+        combined = base.add(change * sign, fill_value=0) if not base.empty else change * sign
+        combined = combined[combined['件数'] > 0].astype('int64').sort_index()
+        result[name] = combined
+    return result
+
+def add_rows(tables, df):
+    """追加した行の分を足した集計表を返す（元の集計表は書き換えない）"""
+    return _combine(tables, build(df), 1)
+
+def remove_rows(tables, df):
+    """削除した行の分を引いた集計表を返す（元の集計表は書き換えない）"""
+    return _combine(tables, build(df), -1)
@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from collections import deque
+import requests
+import streamlit as st
+from gspread.exceptions import APIError
+
+# ==========================================
+# Google Sheets API の呼び出し窓口（クォータ管理・リトライ・同一読み込みの集約）
+# ==========================================
+# gsheets.py からの API 呼び出しは全てここを通す。
+# - 1分あたりの読み込み・書き込み回数を数え、上限に近づいたら自分から待つ
+# - 429 / 5xx / 通信エラーはジッター付きの指数バックオフでリトライする
+# - 複数のセッションから同じ読み込みが同時に来たら、1回の通信の結果を共有する
+
+# Sheets API の既定のクォータ（1分あたり・1ユーザーあたり）に少し余裕を持たせた値
+QUOTA_PER_MINUTE = {'read': 55, 'write': 55}
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 32.0
+
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def _is_retryable(error, idempotent):
+    """
+    リトライしてよいエラーか。429 は処理されずに断られているので常にリトライする。
+    5xx・通信エラーは処理済みの可能性があるため、追記のような冪等でない書き込みではリトライしない。
+    """
+    if isinstance(error, APIError):
+        code = _status_code(error)
+        if code == 429:
+            return True
+        return idempotent and code is not None and code >= 500
+    return idempotent and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def is_rejected(error):
+    """
+    処理されずに断られたことが確かなエラーか（429 などの 4xx）。
+    5xx・通信エラーは処理済みの可能性があるので False。
+    """
+    code = _status_code(error) if isinstance(error, APIError) else None
+    return code is not None and 400 <= code < 500
+
+class SheetsClient:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = {kind: deque() for kind in QUOTA_PER_MINUTE}
+        self._in_flight = {}
+        self._stats = {
+            'requests': 0,       # 実際に送ったリクエスト数（リトライを含む）
+            'throttled': 0,      # 429 (クォータ超過) が返ってきた回数
+            'server_errors': 0,  # 5xx・通信エラーの回数
+            'retries': 0,        # リトライした回数
+            'self_throttled': 0, # クォータを使い切らないよう自分から待った回数
+            'coalesced': 0,      # 同時に来た同じ読み込みを1回にまとめた回数
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _acquire(self, kind):
+        """直近1分間の呼び出し回数が上限に達していれば、枠が空くまで待つ"""
+        limit = QUOTA_PER_MINUTE[kind]
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                history = self._history[kind]
+                while history and now - history[0] >= 60:
+                    history.popleft()
+                if len(history) < limit:
+                    history.append(now)
+                    self._stats['requests'] += 1
+                    return
+                wait_sec = 60 - (now - history[0])
+                self._stats['self_throttled'] += 1
+            time.sleep(wait_sec)
+
+    def _call(self, kind, func, args, kwargs, idempotent=True):
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire(kind)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not _is_retryable(e, idempotent) or attempt == MAX_RETRIES:
+                    raise
+                with self._lock:
+                    if _status_code(e) == 429:
+                        self._stats['throttled'] += 1
+                    else:
+                        self._stats['server_errors'] += 1
+                    self._stats['retries'] += 1
+            # Full Jitter: 0〜(基準 × 2^試行回数) のランダムな時間だけ待つ
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt)))
+
+    def read(self, func, *args, key=None, **kwargs):
+        """
+        読み込みを実行する。key を渡した場合、同じ key の読み込みが実行中なら
+        その結果を待って共有する（戻り値は共有されるので書き換えないこと）。
+        """
+        if key is None:
+            return self._call('read', func, args, kwargs)
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            leader = waiter is None
+            if leader:
+                waiter = {'event': threading.Event(), 'result': None, 'error': None}
+                self._in_flight[key] = waiter
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            waiter['event'].wait()
+            if waiter['error'] is not None:
+                raise waiter['error']
+            return waiter['result']
+        try:
+            waiter['result'] = self._call('read', func, args, kwargs)
+        except Exception as e:
+            waiter['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter['event'].set()
+        return waiter['result']
+
+    def write(self, func, *args, idempotent=True, **kwargs):
+        return self._call('write', func, args, kwargs, idempotent)
+
+@st.cache_resource
+def get_sheets_client():
+    return SheetsClient()
+
+def read(func, *args, key=None, **kwargs):
+    return get_sheets_client().read(func, *args, key=key, **kwargs)
+
+def write(func, *args, idempotent=True, **kwargs):
+    return get_sheets_client().write(func, *args, idempotent=idempotent, **kwargs)
+
+def get_stats():
+    """リクエスト数・429 の回数・リトライ回数などのカウンター（監視用）"""
+    return get_sheets_client().stats()
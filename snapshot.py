@@ -0,0 +1,70 @@
+import os
+import time
+import pandas as pd
+import const as c
+
+# ==========================================
+# 家計簿シートのローカルスナップショット
+# ==========================================
+# パース済みの DataFrame と「最後に読んだ行数・最終行の生データ」を
+# スプレッドシート × シートごとにディスクへ保存しておき、
+# 次回は末尾の追加分だけを取得できるようにする。
+# 家計簿の集計表（rollups.py）も一緒に保存し、追加分だけを足して使い続ける。
+
+SNAPSHOT_DIR = c.LOCAL_DATA_DIR
+
+# 保存形式を変えたときはこの番号を上げて古いスナップショットを捨てる
+SNAPSHOT_FORMAT = 3
+
+# 途中の行を直接編集された場合は末尾の確認では検知できないため、
+# この秒数より古いスナップショットは全件取得し直す
+FULL_RESYNC_SEC = 60 * 60
+
+def _snapshot_path(spreadsheet_id, sheet_name):
+    return os.path.join(SNAPSHOT_DIR, f"{spreadsheet_id}__{sheet_name}.pkl")
+
+def load_snapshot(spreadsheet_id, sheet_name):
+    """保存済みのスナップショットを返す。無い・壊れている・古い場合は None"""
+    path = _snapshot_path(spreadsheet_id, sheet_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        snap = pd.read_pickle(path)
+    except Exception:
+        return None
+    if not isinstance(snap, dict) or snap.get('format') != SNAPSHOT_FORMAT:
+        return None
+    if time.time() - snap.get('synced_at', 0) > FULL_RESYNC_SEC:
+        return None
+    return snap
+
+def save_snapshot(spreadsheet_id, sheet_name, df, row_count, tail_row, synced_at=None, rollups=None):
+    """
+    スナップショットを保存する。
+    row_count はヘッダーを含むシートの行数、tail_row はその最終行の生データ。
+    synced_at を省略した場合は現在時刻（全件取得した時刻として扱う）。
+    rollups は df から作った集計表（無ければ None）。
+    """
+    snap = {
+        'format': SNAPSHOT_FORMAT,
+        'df': df,
+        'rollups': rollups,
+        'row_count': row_count,
+        'tail_row': tail_row,
+        'synced_at': time.time() if synced_at is None else synced_at,
+    }
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        path = _snapshot_path(spreadsheet_id, sheet_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pd.to_pickle(snap, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        # 保存に失敗しても次回全件取得になるだけなので無視する
+        pass
+
+def drop_snapshot(spreadsheet_id, sheet_name):
+    try:
+        os.remove(_snapshot_path(spreadsheet_id, sheet_name))
+    except OSError:
+        pass
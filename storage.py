@@ -0,0 +1,316 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+import pandas as pd
+import streamlit as st
+import const as c
+import decoder
+import gsheets
+import rollups
+
+# ==========================================
+# データの保存先（ストレージ）
+# ==========================================
+# 画面側は保存先を意識せず、ここで作ったストレージのメソッドを呼ぶ。
+# - SheetsStorage: Google スプレッドシート（gsheets.py の関数をそのまま使う）
+# - SqliteStorage: サーバー上の SQLite ファイル（通信が無いので読み書きがミリ秒で終わる）
+# どちらを使うかは st.secrets の users.<ユーザーID>.backend で選ぶ（既定は "sheets"）。
+#
+#   [users.taro]
+#   sheet = "家計簿_太郎"
+#   backend = "sqlite"          # 省略すると "sheets"
+#   db_path = "/data/taro.db"   # 省略すると .kakeibo_cache/<sheet>.sqlite3
+
+BACKENDS = ('sheets', 'sqlite')
+
+class SheetsStorage:
+    """Google スプレッドシートに保存する"""
+    def __init__(self, sh):
+        self.sh = sh
+
+    def start(self):
+        gsheets.start_write_queue(self.sh)
+
+    def load_all_data(self):
+        return gsheets.load_all_data(self.sh)
+
+    def data_version(self):
+        """家計簿のデータのバージョン（集計結果を使い回せるかの判定に使う）"""
+        return (self.sh.id, gsheets.get_data_version(self.sh, '家計簿'))
+
+    def load_kakeibo_data(self):
+        return gsheets.load_kakeibo_data(self.sh)
+
+    def load_kakeibo_rollups(self):
+        return gsheets.load_kakeibo_rollups(self.sh)
+
+    def load_investment_data(self):
+        return gsheets.load_investment_data(self.sh)
+
+    def load_subscription_data(self):
+        return gsheets.load_subscription_data(self.sh)
+
+    def load_price_cache(self):
+        return gsheets.load_price_cache(self.sh)
+
+    def get_anything_memo(self):
+        return gsheets.get_anything_memo(self.sh)
+
+    def add_entries(self, entries):
+        gsheets.add_entries(self.sh, entries)
+
+    def add_entry(self, date, balance_type, category, amount, memo):
+        gsheets.add_entry(self.sh, date, balance_type, category, amount, memo)
+
+    def add_investment_purchase(self, date, investment_name, investment_amount, pay_amount, memo):
+        gsheets.add_investment_purchase(self.sh, date, investment_name, investment_amount, pay_amount, memo)
+
+    def add_subscription(self, service_name, amount, category, pay_day, memo):
+        gsheets.add_subscription(self.sh, service_name, amount, category, pay_day, memo)
+
+    def delete_entries(self, nos):
+        gsheets.delete_entries(self.sh, nos)
+
+    def delete_subscription(self, no):
+        gsheets.delete_subscription(self.sh, no)
+
+    def auto_add_subscriptions(self, df_kakeibo, df_sub=None):
+        return gsheets.auto_add_subscriptions(self.sh, df_kakeibo, df_sub)
+
+    def update_anything_memo(self, text):
+        gsheets.update_anything_memo(self.sh, text)
+
+    def persist_price_cache(self, prices_dict, timestamp, saved_cache=None):
+        return gsheets.persist_price_cache(self.sh, prices_dict, timestamp, saved_cache)
+
+    def pending_kakeibo_data(self):
+        return gsheets.pending_kakeibo_data(self.sh)
+
+    def pending_rows(self, sheet_name):
+        return gsheets.pending_rows(self.sh, sheet_name)
+
+    def write_queue_error(self):
+        return gsheets.write_queue_error()
+
+class SqliteStorage:
+    """
+    ローカルの SQLite ファイルに保存する。
+    No はシートの行番号ではなく各テーブルの連番（削除しても他の行の No は変わらない）。
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # 家計簿を書き換えるたびに増やす。読み込んだ家計簿と集計表はこの番号と一緒に覚えておく
+        self._lock = threading.Lock()
+        self._version = 0
+        self._kakeibo_cache = None
+        self._rollups_cache = None
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS kakeibo ("
+                " no INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " date TEXT NOT NULL, type TEXT NOT NULL, category TEXT NOT NULL,"
+                " amount INTEGER NOT NULL, memo TEXT NOT NULL DEFAULT '');"
+                "CREATE INDEX IF NOT EXISTS kakeibo_date ON kakeibo (date);"
+                "CREATE INDEX IF NOT EXISTS kakeibo_type_date ON kakeibo (type, date);"
+                "CREATE TABLE IF NOT EXISTS investment ("
+                " no INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " date TEXT NOT NULL, name TEXT NOT NULL, quantity REAL NOT NULL,"
+                " pay_amount INTEGER NOT NULL, memo TEXT NOT NULL DEFAULT '');"
+                "CREATE INDEX IF NOT EXISTS investment_name ON investment (name);"
+                "CREATE TABLE IF NOT EXISTS subscription ("
+                " no INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " service_name TEXT NOT NULL, amount INTEGER NOT NULL, category TEXT NOT NULL,"
+                " pay_day INTEGER NOT NULL, memo TEXT NOT NULL DEFAULT '');"
+                "CREATE TABLE IF NOT EXISTS price_cache ("
+                " symbol TEXT PRIMARY KEY, price REAL NOT NULL, fetched_at TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS memo ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), text TEXT NOT NULL);"
+            )
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _query(self, sql, params=()):
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def _execute(self, sql, rows):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(sql, rows)
+
+    def start(self):
+        pass
+
+    def data_version(self):
+        return (self.db_path, self._version)
+
+    def _bump_version(self):
+        with self._lock:
+            self._version += 1
+            self._kakeibo_cache = None
+            self._rollups_cache = None
+
+    # --- 読み込み（列と型は SheetsStorage と同じにする） ---
+    def load_kakeibo_data(self):
+        with self._lock:
+            version, cached = self._kakeibo_cache or (None, None)
+            if version == self._version:
+                return cached
+            version = self._version
+        df = self._query("SELECT no, date, type, category, amount, memo FROM kakeibo ORDER BY no")
+        df.columns = gsheets.KAKEIBO_COLUMNS
+        df['日付'] = decoder.parse_dates(df['日付'])
+        df['金額'] = df['金額'].astype(int)
+        df = decoder.compact_ledger(df)
+        with self._lock:
+            if version == self._version:
+                self._kakeibo_cache = (version, df)
+        return df
+
+    def load_kakeibo_rollups(self):
+        """家計簿の集計表。SQLite は読み込みが速いので、書き換えた後は家計簿から作り直す"""
+        with self._lock:
+            version, cached = self._rollups_cache or (None, None)
+            if version == self._version:
+                return cached
+            version = self._version
+        tables = rollups.build(self.load_kakeibo_data())
+        with self._lock:
+            if version == self._version:
+                self._rollups_cache = (version, tables)
+        return tables
+
+    def load_investment_data(self):
+        df = self._query("SELECT date, name, quantity, pay_amount, memo FROM investment ORDER BY no")
+        df.columns = gsheets.INVESTMENT_COLUMNS
+        df['数量'] = df['数量'].astype(float)
+        df['支払金額'] = df['支払金額'].astype(str)
+        return df
+
+    def load_subscription_data(self):
+        df = self._query("SELECT no, service_name, amount, category, pay_day, memo FROM subscription ORDER BY no")
+        df.columns = ['No'] + gsheets.SUBSCRIPTION_COLUMNS
+        df['金額'] = df['金額'].astype(int)
+        df['支払日'] = df['支払日'].astype(int)
+        return df
+
+    def load_price_cache(self):
+        df = self._query("SELECT symbol, price, fetched_at FROM price_cache")
+        if df.empty:
+            return {}, None
+        return dict(zip(df['symbol'], df['price'].astype(float))), df['fetched_at'].iloc[0]
+
+    def get_anything_memo(self):
+        df = self._query("SELECT text FROM memo WHERE id = 1")
+        return df['text'].iloc[0] if not df.empty else ""
+
+    def load_all_data(self):
+        return {
+            '家計簿': self.load_kakeibo_data(),
+            '投資': self.load_investment_data(),
+            'サブスク': self.load_subscription_data(),
+            '価格キャッシュ': self.load_price_cache(),
+            'なんでもメモ': self.get_anything_memo(),
+        }
+
+    # --- 書き込み ---
+    def add_entries(self, entries):
+        self._execute(
+            "INSERT INTO kakeibo (date, type, category, amount, memo) VALUES (?, ?, ?, ?, ?)",
+            [(str(date).replace('-', '/'), balance_type, category, int(amount), memo or "")
+             for date, balance_type, category, amount, memo in entries],
+        )
+        self._bump_version()
+
+    def add_entry(self, date, balance_type, category, amount, memo):
+        self.add_entries([(date, balance_type, category, amount, memo)])
+
+    def add_investment_purchase(self, date, investment_name, investment_amount, pay_amount, memo):
+        """家計簿（支出/投資費）と投資の行を1トランザクションで書き込む"""
+        date_str = str(date).replace('-', '/')
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO kakeibo (date, type, category, amount, memo) VALUES (?, '支出', '投資費', ?, ?)",
+                (date_str, int(pay_amount), memo or ""),
+            )
+            conn.execute(
+                "INSERT INTO investment (date, name, quantity, pay_amount, memo) VALUES (?, ?, ?, ?, ?)",
+                (date_str, investment_name, float(investment_amount or 0), int(pay_amount), memo or ""),
+            )
+        self._bump_version()
+
+    def add_subscription(self, service_name, amount, category, pay_day, memo):
+        self._execute(
+            "INSERT INTO subscription (service_name, amount, category, pay_day, memo) VALUES (?, ?, ?, ?, ?)",
+            [(service_name, int(amount), category, int(pay_day), memo or "")],
+        )
+
+    def delete_entries(self, nos):
+        self._execute("DELETE FROM kakeibo WHERE no = ?", [(int(no),) for no in nos])
+        self._bump_version()
+
+    def delete_subscription(self, no):
+        self._execute("DELETE FROM subscription WHERE no = ?", [(int(no),)])
+
+    def auto_add_subscriptions(self, df_kakeibo, df_sub=None):
+        if df_sub is None:
+            df_sub = self.load_subscription_data()
+        new_entries = gsheets.due_subscription_entries(df_kakeibo, df_sub)
+        if new_entries:
+            self.add_entries(new_entries)
+        return len(new_entries)
+
+    def update_anything_memo(self, text):
+        self._execute("INSERT OR REPLACE INTO memo (id, text) VALUES (1, ?)", [(text,)])
+
+    def persist_price_cache(self, prices_dict, timestamp, saved_cache=None):
+        if not prices_dict:
+            return False
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM price_cache")
+            conn.executemany(
+                "INSERT INTO price_cache (symbol, price, fetched_at) VALUES (?, ?, ?)",
+                [(symbol, float(price), str(timestamp)) for symbol, price in prices_dict.items()],
+            )
+        return True
+
+    # --- 待ち行列は使わない（書き込みはその場で終わる） ---
+    def pending_kakeibo_data(self):
+        return pd.DataFrame(columns=gsheets.KAKEIBO_COLUMNS[1:])
+
+    def pending_rows(self, sheet_name):
+        return []
+
+    def write_queue_error(self):
+        return None
+
+@st.cache_resource
+def _sqlite_storage(db_path):
+    return SqliteStorage(db_path)
+
+def open_storage(user_cfg):
+    """ユーザー設定（st.secrets の users.<ユーザーID>）からストレージを作る"""
+    backend = user_cfg.get("backend", "sheets")
+    if backend == "sqlite":
+        db_path = user_cfg.get("db_path") or os.path.join(c.LOCAL_DATA_DIR, f"{user_cfg['sheet']}.sqlite3")
+        return _sqlite_storage(db_path)
+    if backend != "sheets":
+        st.error(f"設定エラー: backend は {' / '.join(BACKENDS)} のどれかを指定してください（指定値: {backend}）")
+        st.stop()
+    return SheetsStorage(gsheets.get_worksheet(user_cfg["sheet"]))
+
+def delete_callback(store):
+    target_no = st.session_state.get("delete_input_no")
+    if target_no:
+        try:
+            store.delete_entries([int(target_no)])
+            st.session_state["delete_input_no"] = None
+            st.session_state["del_confirm_ckeck"] = False
+            st.session_state["menu_reset_id"] += 1
+            st.session_state["delete_msg"] = f"No.{target_no} を削除しました！"
+        except Exception as e:
+            st.session_state["delete_msg"] = f"削除エラー: {e}"
@@ -1,56 +1,112 @@
 import streamlit as st
 import pandas as pd
 import datetime
+import time
 import api
 import charts
 import const as c
-import gsheets
-
-def render(df, df_investment, today_ts, worksheet):
-    if not df.empty:
-        df_current = df[df['日付'] <= today_ts]
-        totals = df_current.groupby('区分')['金額'].sum()
-        yen_assets = totals.get('収入', 0) - totals.get('支出', 0)
-    else:
-        yen_assets = 0
+import dashboard_data
+import price_history
+
+JST = datetime.timezone(datetime.timedelta(hours=+9), 'JST')
+
+def format_age(seconds):
+    """経過秒数を「n分前」のような表示にする"""
+    if seconds < 60:
+        return "たった今"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}分前"
+    return f"{int(seconds // 3600)}時間前"
+
+# ==========================================
+# ★ 資産・支出推移のグラフ（期間ごと）
+# ==========================================
+# 表示期間 → (集計の単位, 表示を始める日（None なら全期間）, 軸の書式, ツールチップの書式, ラベルの角度, 見出しの補足)
+PERIOD_VIEWS = {
+    "日ごと": ('日付', lambda today: today - pd.Timedelta(days=30), '%m/%d', '%Y-%m-%d', -45, ""),
+    "週ごと": ('週', lambda today: today - pd.Timedelta(weeks=24), '%m/%d', '%Y-%m-%d', -45, ""),
+    "月ごと": ('年月', lambda today: today - pd.DateOffset(months=12), '%Y-%m', '%Y-%m', 0, ""),
+    "全期間": ('日付', None, '%Y/%m/%d', '%Y-%m-%d', -45, " (全期間・日ごと)"),
+}
+
+def _build_period_charts(view, data, inv_df, today_ts):
+    """選んだ期間のグラフを [(見出し, Altair のチャート), ...] で返す"""
+    x_col, start_of, x_format, tooltip_format, angle, suffix = PERIOD_VIEWS[view]
+    bal, exp, inv = data['balance'][x_col], data['expense'][x_col], inv_df
+    if x_col != '日付':
+        inv = inv.assign(**{x_col: dashboard_data.PERIODS[x_col](pd.DatetimeIndex(inv['日付']))})
+    if start_of is not None:
+        start = start_of(today_ts)
+        bal, exp, inv = bal[bal[x_col] >= start], exp[exp[x_col] >= start], inv[inv[x_col] >= start]
+
+    result = []
+    if start_of is None or not bal.empty:
+        result.append((f"現金残高推移{suffix}", charts.create_balance_chart(bal, x_col, x_format, tooltip_format, angle)))
+        result.append((f"支出推移{suffix}", charts.create_expense_chart(exp, x_col, x_format, tooltip_format, angle)))
+    if not inv.empty:
+        result.append((f"投資資産推移{suffix}", charts.create_investment_chart(inv, x_col, x_format, tooltip_format, angle)))
+    return result
+
+def _period_charts(view, data, inv_df, today_ts, version):
+    """
+    _build_period_charts の結果をセッションごとに覚えておく。
+    家計簿のバージョン・日付・投資資産の推移が変わったら作り直す。
+    バージョンが同じでも集計結果（data）が作り直されていれば（外部の編集を読み直した場合など）作り直す。
+    """
+    key = (version, today_ts, int(pd.util.hash_pandas_object(inv_df, index=False).sum()))
+    cache = st.session_state.get("dashboard_chart_cache")
+    if cache is None or cache['key'] != key or cache['data'] is not data:
+        cache = {'key': key, 'data': data, 'charts': {}}
+        st.session_state["dashboard_chart_cache"] = cache
+    if view not in cache['charts']:
+        cache['charts'][view] = _build_period_charts(view, data, inv_df, today_ts)
+    return cache['charts'][view]
+
+def render(df_investment, today_ts, store, price_cache=None):
+    # ★ 家計簿の行ではなく集計表（日別・月別）から、データのバージョンごとに1回だけ計算する
+    data = dashboard_data.get_dashboard_data(store.load_kakeibo_rollups(), today_ts, store.data_version())
+    # ★ まだシートへ送れていない入力も残高に含める（資産確認で同じ差額を二重に記入しないため）
+    yen_assets = data['yen_assets'] + dashboard_data.pending_balance(store.pending_kakeibo_data(), today_ts)
 
     total_investment_assets = 0
     timestamp_display = ""
+    latencies = {}
     
     if not df_investment.empty:
-        all_prices = {}
         symbols = df_investment['銘柄'].unique().tolist()
-        api_success = True
-        
-        try:
-            prices1 = api.get_crypto_prices(symbols)
-            prices2 = api.get_meme_prices(symbols)
-            prices3 = api.get_metal_prices(symbols)
-            if isinstance(prices1, dict): all_prices.update(prices1)
-            if isinstance(prices2, dict): all_prices.update(prices2)
-            if isinstance(prices3, dict): all_prices.update(prices3)
-            
-            if not all_prices or all(v == 0 for v in all_prices.values()):
-                api_success = False
-        except Exception:
-            api_success = False
-
-        JST = datetime.timezone(datetime.timedelta(hours=+9), 'JST')
-        current_time_str = datetime.datetime.now(JST).strftime("%Y/%m/%d %H:%M:%S")
-
-        if api_success:
-            gsheets.save_price_cache(worksheet, all_prices, current_time_str)
-            timestamp_display = f"{current_time_str} 取得"
+
+        # ★ 価格はバックグラウンドで取得し続けているので、手元にある最新の値を読むだけ（通信を待たない）
+        refresher = api.get_price_refresher()
+        refresher.watch(symbols)
+        quotes = refresher.snapshot()
+        latencies = quotes['latencies']
+
+        if price_cache is None:
+            price_cache = store.load_price_cache()
+        cached_prices, cached_time = price_cache
+
+        if quotes['fetched_at'] is not None:
+            # 最新の取得に含まれなかった銘柄は、保存済みの価格で補う
+            all_prices = dict(cached_prices)
+            all_prices.update(quotes['prices'])
+            fetched_time_str = datetime.datetime.fromtimestamp(quotes['fetched_at'], JST).strftime("%Y/%m/%d %H:%M:%S")
+            timestamp_display = f"{fetched_time_str} 取得 ({format_age(time.time() - quotes['fetched_at'])})"
+            # 価格キャッシュシートへは、価格が変わったときだけ別スレッドで保存する
+            store.persist_price_cache(all_prices, fetched_time_str, price_cache)
+        elif cached_prices:
+            all_prices = cached_prices
+            timestamp_display = f"{cached_time} 取得 (キャッシュ)"
         else:
-            cached_prices, cached_time = gsheets.load_price_cache(worksheet)
-            if cached_prices:
-                all_prices = cached_prices
-                timestamp_display = f"{cached_time} 取得 (キャッシュ)"
-            else:
-                timestamp_display = "取得失敗"
-
-        df_investment['現在レート'] = df_investment['銘柄'].map(all_prices).fillna(0)
-        df_investment['評価額(円)'] = df_investment['数量'] * df_investment['現在レート']
+            all_prices = {}
+            timestamp_display = "取得中…" if quotes['attempted_at'] is None else "取得失敗"
+
+        unpriced = api.unpriceable_symbols(symbols)
+        if unpriced:
+            timestamp_display += f" ／ 価格を取得できない銘柄: {', '.join(map(str, unpriced))}"
+
+        # 読み込んだデータはセッション間で共有されるキャッシュなので、書き換えずに列を足した新しい表にする
+        rates = df_investment['銘柄'].map(all_prices).fillna(0)
+        df_investment = df_investment.assign(**{'現在レート': rates, '評価額(円)': df_investment['数量'] * rates})
         total_investment_assets = df_investment['評価額(円)'].sum()
 
     st.markdown(f"""
@@ -67,7 +123,16 @@ def render(df, df_investment, today_ts, worksheet):
     """, unsafe_allow_html=True)
 
     if timestamp_display:
-        st.caption(f"💡 投資資産レート: {timestamp_display}")
+        latency_help = " / ".join(
+            f"{name}: {sec:.1f}秒" if sec is not None else f"{name}: 時間切れ"
+            for name, sec in latencies.items()
+        )
+        http_stats = api.get_http_stats()
+        if http_stats:
+            connections = sum(v['connections'] for v in http_stats.values())
+            requests_count = sum(v['requests'] for v in http_stats.values())
+            latency_help += f"（通信: 接続 {connections}回 / リクエスト {requests_count}回）"
+        st.caption(f"💡 投資資産レート: {timestamp_display}", help=latency_help or None)
 
     total_all_assets = yen_assets + total_investment_assets
     if total_all_assets > 0:
@@ -107,7 +172,7 @@ def render(df, df_investment, today_ts, worksheet):
     st.write("")
     if not df_investment.empty:
         with st.expander("資産の内訳を見る", expanded=False):
-            display_df = df_investment[['銘柄', '評価額(円)']].copy().rename(columns={'評価額(円)': '評価額'})
+            display_df = df_investment[['銘柄', '評価額(円)']].rename(columns={'評価額(円)': '評価額'})
             display_df = display_df.groupby('銘柄', as_index=False).sum(numeric_only=True)
             display_df['評価額'] = display_df['評価額'].astype(int)
             display_df = display_df.sort_values(by='評価額', ascending=False)
@@ -122,119 +187,57 @@ def render(df, df_investment, today_ts, worksheet):
     # グラフ表示 ── 未来データ除外 ＆ 期間フィルターを徹底 ──
     # ==================================================
     st.subheader("資産・支出推移")
-    if not df.empty:
-        base_df = df.copy()
-        base_df['グラフ金額'] = base_df.apply(lambda x: -x['金額'] if x['区分'] == '支出' else x['金額'], axis=1)
-        base_df = base_df.sort_values('日付')
-        base_df['現金推移'] = base_df['グラフ金額'].cumsum()
-        base_df['年月'] = base_df['日付'].apply(lambda x: x.replace(day=1))
-        base_df['週'] = base_df['日付'] - pd.to_timedelta(base_df['日付'].dt.weekday, unit='D')
-        
-        # 1. 2026/01/01 以降のデータに絞る
-        start_date = pd.to_datetime('2026-01-01')
-        graph_df = base_df[base_df['日付'] >= start_date]
-        
-        # 2. 現在（today_ts）より未来のデータは完全に除外する
-        graph_df = graph_df[graph_df['日付'] <= today_ts]
-
-        if not graph_df.empty:
-            tab_day, tab_week, tab_month, tab_all = st.tabs(["日ごと", "週ごと", "月ごと", "全期間"])
-            
-            with tab_day:
-                start_30d = today_ts - pd.Timedelta(days=30)
-                df_day = graph_df[graph_df['日付'] >= start_30d]
-                if not df_day.empty:
-                    st.caption("現金残高推移")
-                    st.altair_chart(charts.create_balance_chart(df_day, '日付', '%m/%d', '%Y-%m-%d', -45), use_container_width=True)
-                    st.caption("支出推移")
-                    st.altair_chart(charts.create_expense_chart(df_day, '日付', '%m/%d', '%Y-%m-%d', -45), use_container_width=True)
-                    
-            with tab_week:
-                start_24w = today_ts - pd.Timedelta(weeks=24)
-                df_week = graph_df[graph_df['週'] >= start_24w]
-                if not df_week.empty:
-                    st.caption("現金残高推移")
-                    st.altair_chart(charts.create_balance_chart(df_week, '週', '%m/%d', '%Y-%m-%d', -45), use_container_width=True)
-                    st.caption("支出推移")
-                    st.altair_chart(charts.create_expense_chart(df_week, '週', '%m/%d', '%Y-%m-%d', -45), use_container_width=True)
-            
-            with tab_month:
-                start_12m = today_ts - pd.DateOffset(months=12)
-                df_month = graph_df[graph_df['年月'] >= start_12m]
-                if not df_month.empty:
-                    st.caption("現金残高推移")
-                    st.altair_chart(charts.create_balance_chart(df_month, '年月', '%Y-%m', '%Y-%m', 0), use_container_width=True)
-                    st.caption("支出推移")
-                    st.altair_chart(charts.create_expense_chart(df_month, '年月', '%Y-%m', '%Y-%m', 0), use_container_width=True)
-                    
-            with tab_all:
-                st.caption("現金残高推移 (全期間・日ごと)")
-                st.altair_chart(charts.create_balance_chart(graph_df, '日付', '%Y/%m/%d', '%Y-%m-%d', -45), use_container_width=True)
-                st.caption("支出推移 (全期間・日ごと)")
-                st.altair_chart(charts.create_expense_chart(graph_df, '日付', '%Y/%m/%d', '%Y-%m-%d', -45), use_container_width=True)
+
+    # ★ 投資資産の推移（ローカルの価格履歴から日ごとの評価額を計算）
+    inv_df = pd.DataFrame({'日付': pd.Series(dtype='datetime64[ns]'), '評価額': pd.Series(dtype=float)})
+    if not df_investment.empty:
+        daily_prices = price_history.load_daily_prices(df_investment['銘柄'].unique().tolist())
+        inv_df = price_history.compute_portfolio_value(df_investment, daily_prices)
+        inv_df = inv_df[inv_df['日付'] <= today_ts]
+
+    balance = data['balance']
+    if not balance['日付'].empty:
+        # ★ 選んだ期間のグラフだけを作って送る（一度表示した期間のグラフは使い回す）
+        view = st.radio("表示期間", list(PERIOD_VIEWS), horizontal=True, label_visibility="collapsed", key="dashboard_period")
+        for caption, chart in _period_charts(view, data, inv_df, today_ts, store.data_version()):
+            st.caption(caption)
+            st.altair_chart(chart, use_container_width=True)
 
     st.divider()
 
     # --- 光熱費の比較 ---
     st.subheader("光熱費の比較")
-    if not df.empty:
-        utils_df = df[(df['区分'] == '支出') & (df['カテゴリー'] == '生活費')].copy()
-        def classify_utility(memo):
-            memo_str = str(memo)
-            if '電気' in memo_str: return '電気'
-            if 'ガス' in memo_str: return 'ガス'
-            if '水道' in memo_str: return '水道'
-            return None
-        
-        utils_df['種類'] = utils_df['メモ'].apply(classify_utility)
-        utils_df = utils_df.dropna(subset=['種類'])
-        
-        if not utils_df.empty:
-            utils_df['年月'] = utils_df['日付'].apply(lambda x: x.replace(day=1).strftime('%Y-%m'))
-            utils_df = utils_df[utils_df['日付'] <= today_ts]
-            utils_grouped = utils_df.groupby(['年月', '種類'])['金額'].sum().reset_index()
-            st.altair_chart(charts.create_utilities_chart(utils_grouped), use_container_width=True)
+    if not data['utilities'].empty:
+        st.altair_chart(charts.create_utilities_chart(data['utilities']), use_container_width=True)
 
     st.divider()
 
     # --- 支出内訳 (横棒グラフ) ---
     st.subheader("支出内訳 (月別)")
-    if not df.empty:
-        pie_df = df.copy()
-        pie_df['年月'] = pie_df['日付'].apply(lambda x: x.replace(day=1))
-        months_series = pie_df['年月'].drop_duplicates()
-        months_list = months_series[(months_series >= pd.to_datetime('2026-01-01')) & (months_series <= today_ts.replace(day=1))].sort_values(ascending=False)
-        
-        if not months_list.empty:
-            tabs = st.tabs(months_list.dt.strftime('%Y/%m').tolist())
-            for tab, month_date in zip(tabs, months_list):
-                with tab:
-                    target_month_df = pie_df[(pie_df['年月'] == month_date) & (pie_df['区分'] == '支出')]
-                    month_total = target_month_df['金額'].sum()
-                    st.metric(label=f"{month_date.strftime('%Y/%m')}の支出合計", value=f"{month_total:,} 円")
-                    
-                    if month_total > 0:
-                        cat_grouped = target_month_df.groupby('カテゴリー')['金額'].sum()
-                        
-                        # --- 並び順を EXPENSE_CATEGORIES の順序に固定 ---
-                        ordered_cats = [cat for cat in c.EXPENSE_CATEGORIES if cat in cat_grouped]
-                        other_cats = [cat for cat in cat_grouped.index if cat not in ordered_cats]
-                        cat_grouped = cat_grouped.reindex(ordered_cats + other_cats).dropna()
-                        
-                        bars_html = ""
-                        legend_html = ""
-                        for cat, val in cat_grouped.items():
-                            if val > 0:
-                                ratio = (val / month_total) * 100
-                                color = c.PIE_CHART_CATEGORIES_COLORS.get(cat, '#CFCFCF')
-                                bars_html += f'<div style="width: {ratio}%; background-color: {color};" title="{cat}: {ratio:.1f}%"></div>'
-                                legend_html += f' <span style="display:inline-block; margin: 4px 10px 4px 0;"><span style="color:{color};">■</span> {cat} ({val:,}円)</span>'
-                        
-                        st.markdown(f"""
-                        <div style="display: flex; width: 100%; height: 24px; background-color: #e0e0e0; border-radius: 5px; overflow: hidden; margin-bottom: 8px;">{bars_html}</div>
-                        <div style="font-size: 13px; color: #333; line-height: 1.5;">{legend_html}</div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.info(f"{month_date.strftime('%Y/%m')} の支出データはありません")
+    if data['months']:
+        # ★ 月が増えてもタブを全部作らず、選んだ月の内訳だけを表示する
+        month_date = st.selectbox(
+            "表示する月", data['months'], format_func=lambda month: month.strftime('%Y/%m'),
+            label_visibility="collapsed", key="dashboard_breakdown_month",
+        )
+        month_total = data['month_totals'][month_date]
+        st.metric(label=f"{month_date.strftime('%Y/%m')}の支出合計", value=f"{month_total:,} 円")
+
+        if month_total > 0:
+            bars_html = ""
+            legend_html = ""
+            for cat, val in data['month_categories'][month_date].items():
+                if val > 0:
+                    ratio = (val / month_total) * 100
+                    color = c.PIE_CHART_CATEGORIES_COLORS.get(cat, '#CFCFCF')
+                    bars_html += f'<div style="width: {ratio}%; background-color: {color};" title="{cat}: {ratio:.1f}%"></div>'
+                    legend_html += f' <span style="display:inline-block; margin: 4px 10px 4px 0;"><span style="color:{color};">■</span> {cat} ({val:,}円)</span>'
+
+            st.markdown(f"""
+            <div style="display: flex; width: 100%; height: 24px; background-color: #e0e0e0; border-radius: 5px; overflow: hidden; margin-bottom: 8px;">{bars_html}</div>
+            <div style="font-size: 13px; color: #333; line-height: 1.5;">{legend_html}</div>
+            """, unsafe_allow_html=True)
+        else:
+            st.info(f"{month_date.strftime('%Y/%m')} の支出データはありません")
 
     return yen_assets
\ No newline at end of file
@@ -1,24 +1,68 @@
 import streamlit as st
-import time
+import const as c
 import gsheets
+import history_search
+import storage
 
-def render(df, worksheet):
+def _category_options(df):
+    """絞り込みの項目の候補（入力画面と同じ順、それ以外は後ろ）"""
+    present = set(df['カテゴリー'].astype(str).unique())
+    ordered = [cat for cat in c.EXPENSE_CATEGORIES + c.INCOME_CATEGORIES if cat in present]
+    return list(dict.fromkeys(ordered)) + sorted(present - set(ordered))
+
+def render(df, store):
     st.subheader("入力履歴")
     if not df.empty:
-        df_display = df[['No','日付','区分','金額','カテゴリー','メモ']].copy().rename(columns={'カテゴリー': '項目'})
-        df_display['日付'] = df_display['日付'].dt.strftime('%y/%m/%d')
-        df_display['メモ'] = df_display['メモ'].astype(str).apply(lambda x: (x[:3] + '..') if len(x) > 2 else x)
-        
+        # ★ 家計簿全体から絞り込み、表示するページの行だけを送る（メモは索引で検索する）
+        with st.expander("検索・絞り込み", expanded=False):
+            period = st.date_input("期間", value=(), format="YYYY/MM/DD", key="history_period")
+            categories = st.multiselect("項目", _category_options(df), key="history_categories")
+            memo_query = st.text_input("メモ", placeholder="メモの一部（例: 電気）", key="history_memo").strip()
+        start = period[0] if len(period) > 0 else None
+        end = period[1] if len(period) > 1 else start
+        index = history_search.get_memo_index(store.data_version()[0], df['メモ']) if memo_query else None
+        positions = history_search.search(df, index, start, end, categories, memo_query)
+
+        pages = history_search.page_count(positions)
+        if st.session_state.get("history_page", 1) > pages:
+            st.session_state["history_page"] = pages
+        page = st.number_input(f"ページ（全 {pages} ページ）", min_value=1, max_value=pages, step=1, key="history_page")
+        df_page = history_search.get_page(df, positions, page)
+
+        if df_page.empty:
+            st.info("条件に合うデータがありません")
+        else:
+            first = (page - 1) * history_search.PAGE_SIZE + 1
+            st.caption(f"{len(positions):,}件中 {first:,}〜{first + len(df_page) - 1:,}件目（新しい順）")
+            df_display = df_page[['No','日付','区分','金額','カテゴリー','メモ']].rename(columns={'カテゴリー': '項目'})
+            df_display['日付'] = df_display['日付'].dt.strftime('%y/%m/%d')
+            df_display['メモ'] = df_display['メモ'].astype(str).apply(lambda x: (x[:3] + '..') if len(x) > 2 else x)
+
+            st.dataframe(
+                df_display.style
+                .map(gsheets.color_coding, subset=['区分'])
+                .format({"金額": "{:,} 円"})
+                .set_properties(**{'background-color': '#ede4ce', 'border-color': '#A1A3A6', 'border-style': 'solid'}),
+                use_container_width=True, height=240, hide_index=True
+            )
+    else:
+        st.info("まだデータがありません")
+
+    # --- 未同期（待ち行列にあってまだシートへ送れていない）の入力 ---
+    df_pending = store.pending_kakeibo_data()
+    if not df_pending.empty:
+        st.caption(f"⏳ 未同期の入力が {len(df_pending)}件 あります（まもなくスプレッドシートに反映されます）")
+        pending_display = df_pending[['日付','区分','金額','カテゴリー','メモ']].rename(columns={'カテゴリー': '項目'})
+        pending_display['日付'] = pending_display['日付'].dt.strftime('%y/%m/%d')
         st.dataframe(
-            # ここで最新50件に絞り込み！
-            df_display.iloc[::-1].head(50).style
+            pending_display.iloc[::-1].style
             .map(gsheets.color_coding, subset=['区分'])
-            .format({"金額": "{:,} 円"})
-            .set_properties(**{'background-color': '#ede4ce', 'border-color': '#A1A3A6', 'border-style': 'solid'}),
-            use_container_width=True, height=240, hide_index=True
+            .format({"金額": "{:,} 円"}),
+            use_container_width=True, hide_index=True
         )
-    else:
-        st.info("まだデータがありません")
+        error = store.write_queue_error()
+        if error:
+            st.warning(f"送信に失敗したため再送を待っています: {error}")
 
     st.subheader("データの削除")
     if "delete_msg" not in st.session_state: st.session_state["delete_msg"] = None
@@ -30,8 +74,6 @@ def render(df, worksheet):
         else:
             st.success(st.session_state["delete_msg"])
             st.session_state["delete_msg"] = None
-            time.sleep(1)
-            st.rerun()
 
     with st.expander("削除メニューを開く", expanded=False):
         if not df.empty:
@@ -42,10 +84,10 @@ def render(df, worksheet):
                     target_row = df[df['No'] == target_no]
                     if not target_row.empty:
                         st.warning("⚠️ 以下のデータを本当に削除しますか？")
-                        preview_df = target_row[['No','日付','区分','金額','カテゴリー','メモ']].copy().rename(columns={'カテゴリー': '項目'})
+                        preview_df = target_row[['No','日付','区分','金額','カテゴリー','メモ']].rename(columns={'カテゴリー': '項目'})
                         preview_df['日付'] = preview_df['日付'].dt.strftime('%y/%m/%d')
                         st.dataframe(preview_df.style.map(gsheets.color_coding, subset=['区分']).format({"金額": "{:,} 円"}), use_container_width=True, hide_index=True)
-                        st.button("はい、削除します", on_click=gsheets.delete_callback)
+                        st.button("はい、削除します", on_click=storage.delete_callback, args=(store,))
                     else: st.error("そのNoのデータは見つかりませんでした。")
                 else: st.info("Noを入力してください。")
         else: st.info("データがありません。")
\ No newline at end of file
@@ -1,8 +1,6 @@
 import streamlit as st
 import datetime
-import time
 import const as c
-import gsheets
 import streamlit.components.v1 as components
 
 def render_salary_form():
@@ -87,38 +85,55 @@ def render_bonus_form():
         
     return vals
 
-def process_salary_entry(worksheet, date, vals, memo):
-    """給与内訳のスプレッドシートへの書き込み処理"""
-    if vals['本給'] > 0: gsheets.add_entry(worksheet, date, '収入', '給与', vals['本給'], f"本給 {memo}".strip())
-    if vals['超勤手当'] > 0: gsheets.add_entry(worksheet, date, '収入', '給与', vals['超勤手当'], f"超勤手当 {memo}".strip())
-    if vals['リモートワーク手当'] > 0: gsheets.add_entry(worksheet, date, '収入', '給与', vals['リモートワーク手当'], f"リモートワーク手当 {memo}".strip())
-    if vals['通勤手当'] > 0: gsheets.add_entry(worksheet, date, '収入', '給与', vals['通勤手当'], f"通勤手当 {memo}".strip())
-    if vals['その他（収入）'] > 0: gsheets.add_entry(worksheet, date, '収入', '給与', vals['その他（収入）'], f"その他（収入） {memo}".strip())
-    
-    if vals['健康保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['健康保険'], f"保険 健康保険 {memo}".strip())
-    if vals['厚年保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['厚年保険'], f"保険 厚年保険 {memo}".strip())
-    if vals['雇用保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['雇用保険'], f"保険 雇用保険 {memo}".strip())
-    if vals['所得税'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['所得税'], f"税金 所得税 {memo}".strip())
-    
-    if vals['持株積立'] > 0: gsheets.add_entry(worksheet, date, '支出', '投資費', vals['持株積立'], f"株 持株積立 {memo}".strip())
-    if vals['社宅利用料'] > 0: gsheets.add_entry(worksheet, date, '支出', '生活費', vals['社宅利用料'], f"その他 社宅利用料 {memo}".strip())
-    if vals['生命保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '生活費', vals['生命保険'], f"保険 生命保険 {memo}".strip())
-    if vals['組合費'] > 0: gsheets.add_entry(worksheet, date, '支出', '生活費', vals['組合費'], f"その他 組合費 {memo}".strip())
-    if vals['食堂喫食代'] > 0: gsheets.add_entry(worksheet, date, '支出', '食費', vals['食堂喫食代'], f"社食 食堂喫食代 {memo}".strip())
-    if vals['その他（支出）'] > 0: gsheets.add_entry(worksheet, date, '支出', 'その他', vals['その他（支出）'], f"その他（支出） {memo}".strip())
+# 給与・賞与の内訳項目 → (区分, カテゴリー, メモの接頭辞)
+SALARY_ITEMS = [
+    ('本給', '収入', '給与', '本給'),
+    ('超勤手当', '収入', '給与', '超勤手当'),
+    ('リモートワーク手当', '収入', '給与', 'リモートワーク手当'),
+    ('通勤手当', '収入', '給与', '通勤手当'),
+    ('その他（収入）', '収入', '給与', 'その他（収入）'),
+    ('健康保険', '支出', '税金', '保険 健康保険'),
+    ('厚年保険', '支出', '税金', '保険 厚年保険'),
+    ('雇用保険', '支出', '税金', '保険 雇用保険'),
+    ('所得税', '支出', '税金', '税金 所得税'),
+    ('持株積立', '支出', '投資費', '株 持株積立'),
+    ('社宅利用料', '支出', '生活費', 'その他 社宅利用料'),
+    ('生命保険', '支出', '生活費', '保険 生命保険'),
+    ('組合費', '支出', '生活費', 'その他 組合費'),
+    ('食堂喫食代', '支出', '食費', '社食 食堂喫食代'),
+    ('その他（支出）', '支出', 'その他', 'その他（支出）'),
+]
+BONUS_ITEMS = [
+    ('賞与額', '収入', '賞与', '賞与'),
+    ('その他（収入）', '収入', '賞与', 'その他（収入）'),
+    ('健康保険', '支出', '税金', '保険 健康保険'),
+    ('厚年保険', '支出', '税金', '保険 厚年保険'),
+    ('雇用保険', '支出', '税金', '保険 雇用保険'),
+    ('所得税', '支出', '税金', '税金 所得税'),
+    ('その他（支出）', '支出', 'その他', 'その他（支出）'),
+]
 
-def process_bonus_entry(worksheet, date, vals, memo):
-    """賞与内訳のスプレッドシートへの書き込み処理"""
-    if vals['賞与額'] > 0: gsheets.add_entry(worksheet, date, '収入', '賞与', vals['賞与額'], f"賞与 {memo}".strip())
-    if vals['その他（収入）'] > 0: gsheets.add_entry(worksheet, date, '収入', '賞与', vals['その他（収入）'], f"その他（収入） {memo}".strip())
-    
-    if vals['健康保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['健康保険'], f"保険 健康保険 {memo}".strip())
-    if vals['厚年保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['厚年保険'], f"保険 厚年保険 {memo}".strip())
-    if vals['雇用保険'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['雇用保険'], f"保険 雇用保険 {memo}".strip())
-    if vals['所得税'] > 0: gsheets.add_entry(worksheet, date, '支出', '税金', vals['所得税'], f"税金 所得税 {memo}".strip())
-    if vals['その他（支出）'] > 0: gsheets.add_entry(worksheet, date, '支出', 'その他', vals['その他（支出）'], f"その他（支出） {memo}".strip())
+def build_breakdown_entries(items, date, vals, memo):
+    """内訳の入力値から、金額が0より大きい項目だけを家計簿の行にする"""
+    return [
+        (date, balance_type, category, vals[key], f"{prefix} {memo}".strip())
+        for key, balance_type, category, prefix in items
+        if vals[key] > 0
+    ]
 
-def render(worksheet, today_jst):
+def process_salary_entry(store, date, vals, memo):
+    """給与内訳のスプレッドシートへの書き込み処理（1回のリクエストでまとめて書き込む）"""
+    entries = build_breakdown_entries(SALARY_ITEMS, date, vals, memo)
+    if entries:
+        store.add_entries(entries)
+
+def process_bonus_entry(store, date, vals, memo):
+    """賞与内訳のスプレッドシートへの書き込み処理（1回のリクエストでまとめて書き込む）"""
+    entries = build_breakdown_entries(BONUS_ITEMS, date, vals, memo)
+    if entries:
+        store.add_entries(entries)
+
+def render(store, today_jst):
     st.subheader("収支入力")
 
     # --- 区分とカテゴリー選択 ---
@@ -172,23 +187,25 @@ def render(worksheet, today_jst):
             memo = st.text_input('メモ（任意）')
             submit_btn = st.form_submit_button('登録する')
 
+    # --- 登録結果のメッセージ（登録後の再実行で1回だけ表示する） ---
+    if st.session_state.get("entry_msg"):
+        kind, msg = st.session_state.pop("entry_msg")
+        st.success(msg) if kind == "success" else st.info(msg)
+        st.balloons()
+
     # --- 送信処理 ---
     if submit_btn:
         if balance_type == "収入" and category == "給与":
             try:
-                process_salary_entry(worksheet, date, entry_vals, memo)
-                st.success('給与・各種控除を一括登録しました。')
-                st.balloons()
-                time.sleep(3)
+                process_salary_entry(store, date, entry_vals, memo)
+                st.session_state["entry_msg"] = ("success", '給与・各種控除を一括登録しました。')
                 st.rerun()
             except Exception as e:
                 st.error(f'書き込みエラー: {e}')
         elif balance_type == "収入" and category == "賞与":
             try:
-                process_bonus_entry(worksheet, date, entry_vals, memo)
-                st.success('賞与・各種控除を一括登録しました。')
-                st.balloons()
-                time.sleep(3)
+                process_bonus_entry(store, date, entry_vals, memo)
+                st.session_state["entry_msg"] = ("success", '賞与・各種控除を一括登録しました。')
                 st.rerun()
             except Exception as e:
                 st.error(f'書き込みエラー: {e}')
@@ -202,11 +219,9 @@ def render(worksheet, today_jst):
                     st.warning('金額が0円です。入力してください。')
                 else:
                     try:
-                        gsheets.add_entry(worksheet, date, balance_type, category, amount, final_memo)
+                        store.add_entry(date, balance_type, category, amount, final_memo)
                         msg = f'お疲れさま！ {category} : {amount}円を登録しました。' if balance_type == "収入" else f'{category} ({sub_category if sub_category else ""}) : {amount}円を登録しました。'
-                        st.success(msg) if balance_type == "収入" else st.info(msg)
-                        st.balloons()
-                        time.sleep(3)
+                        st.session_state["entry_msg"] = ("success" if balance_type == "収入" else "info", msg)
                         st.rerun()
                     except Exception as e:
                         st.error(f'書き込みエラー: {e}')
@@ -215,11 +230,8 @@ def render(worksheet, today_jst):
                 elif amount is None or amount == 0: st.warning('金額を入力してください。')
                 else:
                     try:
-                        gsheets.add_entry(worksheet, date, "支出", "投資費", amount, final_memo)
-                        gsheets.add_investment_data(worksheet, date, investment_name, investment_amount, amount, final_memo)
-                        st.success(f'{investment_name}を登録しました！')
-                        st.balloons()
-                        time.sleep(3)
+                        store.add_investment_purchase(date, investment_name, investment_amount, amount, final_memo)
+                        st.session_state["entry_msg"] = ("success", f'{investment_name}を登録しました！')
                         st.rerun()
                     except Exception as e:
                         st.error(f'書き込みエラー:{e}')
\ No newline at end of file
@@ -1,10 +1,10 @@
 import streamlit as st
 import const as c
-import gsheets
 
-def render(worksheet):
+def render(store, df_sub=None):
     st.subheader("サブスク管理")
-    df_sub = gsheets.load_subscription_data(worksheet)
+    if df_sub is None:
+        df_sub = store.load_subscription_data()
     if not df_sub.empty:
         monthly_total = df_sub['金額'].sum()
         yearly_total = monthly_total * 12
@@ -25,6 +25,11 @@ def render(worksheet):
         st.dataframe(display_sub.style.set_properties(**{'background-color': '#ede4ce', 'border-color': '#A1A3A6', 'border-style': 'solid'}), hide_index=True, use_container_width=True)
     else:
         st.info("サブスクはまだ登録されていません。")
+    pending_count = len(store.pending_rows('サブスク'))
+    if pending_count:
+        st.caption(f"⏳ 同期待ちのサブスクが {pending_count}件 あります（まもなく反映されます）")
+    if st.session_state.get("sub_msg"):
+        st.success(st.session_state.pop("sub_msg"))
 
     with st.expander("サブスクを追加する", expanded=False):
         with st.form(key="sub_add_form", clear_on_submit=True):
@@ -39,8 +44,8 @@ def render(worksheet):
                 st.warning("サービス名と金額を入力してください。")
             else:
                 try:
-                    gsheets.add_subscription(worksheet, sub_service_name, sub_amount, sub_category, sub_pay_day, sub_memo)
-                    st.success(f"「{sub_service_name}」を登録しました！")
+                    store.add_subscription(sub_service_name, sub_amount, sub_category, sub_pay_day, sub_memo)
+                    st.session_state["sub_msg"] = f"「{sub_service_name}」を登録しました！"
                     st.rerun()
                 except Exception as e: st.error(f"登録エラー: {e}")
 
@@ -57,8 +62,8 @@ def render(worksheet):
                     st.dataframe(preview.style.set_properties(**{'background-color': '#ede4ce', 'border-color': '#A1A3A6', 'border-style': 'solid'}), hide_index=True, use_container_width=True)
                     if st.button("はい、削除します", key="sub_delete_btn"):
                         try:
-                            gsheets.delete_subscription(worksheet, int(target_row.iloc[0]['No']))
-                            st.success(f"「{del_target}」を削除しました！")
+                            store.delete_subscription(int(target_row.iloc[0]['No']))
+                            st.session_state["sub_msg"] = f"「{del_target}」を削除しました！"
                             st.rerun()
                         except Exception as e: st.error(f"削除エラー: {e}")
         else: st.info("削除するサブスクがありません。")
\ No newline at end of file
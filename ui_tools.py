@@ -1,9 +1,7 @@
 import streamlit as st
-import time
 import const as c
-import gsheets
 
-def render_asset_check(worksheet, yen_assets, today_jst):
+def render_asset_check(store, yen_assets, today_jst):
     st.subheader("資産確認・調整")
     with st.expander("資産確認を開く", expanded=False):
         st.caption("現在の残高・未払い額を入力してください")
@@ -20,22 +18,27 @@ def render_asset_check(worksheet, yen_assets, today_jst):
         diff = real_assets - int(yen_assets)
         col3.metric("差額", f"{diff:,} 円", delta=f"{diff:,}")
 
-        if diff != 0:
+        pending = store.pending_kakeibo_data()
+        if st.session_state.get("asset_check_msg"):
+            st.success(st.session_state.pop("asset_check_msg"))
+        elif not pending.empty and (pending['メモ'].astype(str) == '資産調整').any():
+            # 前回の調整がまだシートへ送れていない間は、同じ差額を二重に記入させない
+            st.info("⏳ 資産調整の入力を送信中です。反映されるまでお待ちください")
+        elif diff != 0:
             st.warning(f"{'不足' if diff < 0 else '超過'} {abs(diff):,} 円のズレがあります")
             if st.button("この差額を家計簿に記入する"):
                 b_type = '収入' if diff > 0 else '支出'
                 # 調整時の日付もJSTを使用
-                gsheets.add_entry(worksheet, today_jst, b_type, 'その他', abs(diff), '資産調整')
-                st.success(f"差額 {abs(diff):,} 円を「その他」で記入しました！")
-                time.sleep(1)
+                store.add_entry(today_jst, b_type, 'その他', abs(diff), '資産調整')
+                st.session_state["asset_check_msg"] = f"差額 {abs(diff):,} 円を「その他」で記入しました！"
                 st.rerun()
         else:
             st.success("✅ アプリ上の資産と実際の資産が一致しています！")
 
-def render_memo(worksheet):
+def render_memo(store, memo_text=None):
     st.subheader("なんでもメモ")
     if 'my_memo_content' not in st.session_state:
-        st.session_state['my_memo_content'] = gsheets.get_anything_memo(worksheet)
+        st.session_state['my_memo_content'] = memo_text if memo_text is not None else store.get_anything_memo()
     if "memo_area" not in st.session_state:
         st.session_state["memo_area"] = st.session_state['my_memo_content']
 
@@ -50,13 +53,15 @@ def render_memo(worksheet):
     else:
         btn_type, btn_label = "secondary", "保存済み"
 
+    if st.session_state.get("memo_msg"):
+        st.success(st.session_state.pop("memo_msg"))
+
     if st.button(btn_label, type=btn_type):
         if is_unsaved:
             new_text = st.session_state["memo_area"]
-            gsheets.update_anything_memo(worksheet, new_text)
+            store.update_anything_memo(new_text)
             st.session_state['my_memo_content'] = new_text
-            st.success("保存しました！")
-            time.sleep(0.5)
+            st.session_state["memo_msg"] = "保存しました！"
             st.rerun()
         else:
             st.info("変更点はありません。")
\ No newline at end of file
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import const as c
+
+# ==========================================
+# 書き込みの待ち行列（ローカルの先行書き込みログ）
+# ==========================================
+# 入力された行はまず SQLite に保存し、バックグラウンドのスレッドが
+# シートごとにまとめて Google スプレッドシートへ追記する。
+# 送信に失敗しても行はディスクに残り、間隔を空けて再送される（アプリを再起動しても消えない）。
+
+DB_PATH = os.path.join(c.LOCAL_DATA_DIR, 'write_queue.sqlite3')
+
+# 1回の追記でまとめて送る最大行数
+FLUSH_BATCH_ROWS = 200
+
+# 送信に失敗したときの再送間隔（失敗が続くほど延ばす）
+RETRY_BASE_SEC = 5
+RETRY_MAX_SEC = 300
+
+# 待ち行列が空のときも、この間隔で念のため確認する
+IDLE_CHECK_SEC = 60
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pending ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " spreadsheet_id TEXT NOT NULL,"
+        " sheet_name TEXT NOT NULL,"
+        " row_json TEXT NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " last_error TEXT"
+        ")"
+    )
+    # 送信直前に確かめたシートの最終行（書き込まれたか分からない失敗のときだけ入る）
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(pending)")}
+    if 'sent_after_row' not in columns:
+        conn.execute("ALTER TABLE pending ADD COLUMN sent_after_row INTEGER")
+    return conn
+
+class PossiblyWritten(Exception):
+    """
+    送信した行がシートに書き込まれたかもしれない失敗（通信エラー・5xx など）。
+    after_row は送信直前に確かめたシートの最終行で、書き込まれていれば行はその直下にある。
+    """
+    def __init__(self, after_row, error):
+        super().__init__(str(error))
+        self.after_row = after_row
+
+class WriteQueue:
+    """
+    flush(sh, シート名, 行のリスト, sent_after_row) でシートへ追記する。
+    flush が例外を出した行は待ち行列に残り、後で再送される。
+    例外が PossiblyWritten のときはその after_row を覚えておき、次の flush に sent_after_row として渡す
+    （None 以外なら前回の送信が実際には反映されている可能性があるので、その行の直下を確かめてから送る）。
+    """
+    def __init__(self, flush):
+        self._flush = flush
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._books = {}  # spreadsheet_id -> gspread の Spreadsheet
+        self._thread = None
+        self._failures = 0
+        self._last_error = None
+
+    def attach(self, sh):
+        """
+        送信先のスプレッドシートを登録し、前回から残っている行があれば送り始める。
+        画面の再描画のたびに呼ばれるので、初めて登録したときだけスレッドを起こす
+        （毎回起こすと、送信に失敗しているときの再送間隔が操作のたびに縮んでしまう）。
+        """
+        with self._lock:
+            is_new = sh.id not in self._books
+            self._books[sh.id] = sh
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+        if is_new:
+            self._wake.set()
+
+    def enqueue(self, sh, rows_by_sheet):
+        """
+        行を待ち行列に保存する（複数シート分も1トランザクションで保存する）。
+        rows_by_sheet: {シート名: [[A, B, C, D, E], ...]}
+        """
+        now = time.time()
+        records = [
+            (sh.id, name, json.dumps(row, ensure_ascii=False), now)
+            for name, rows in rows_by_sheet.items() for row in rows
+        ]
+        if not records:
+            return
+        with closing(_connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO pending (spreadsheet_id, sheet_name, row_json, created_at) VALUES (?, ?, ?, ?)",
+                records,
+            )
+        self.attach(sh)
+        # 新しい行はすぐに送る
+        self._wake.set()
+
+    def pending(self, spreadsheet_id, sheet_name=None):
+        """
+        未送信の行を古い順に返す。
+        [{'id', 'sheet_name', 'row', 'created_at', 'attempts', 'last_error', 'sent_after_row'}, ...]
+        """
+        if not os.path.exists(DB_PATH):
+            return []
+        query = (
+            "SELECT id, sheet_name, row_json, created_at, attempts, last_error, sent_after_row"
+            " FROM pending WHERE spreadsheet_id = ?"
+        )
+        params = [spreadsheet_id]
+        if sheet_name is not None:
+            query += " AND sheet_name = ?"
+            params.append(sheet_name)
+        with closing(_connect()) as conn:
+            rows = conn.execute(query + " ORDER BY id", params).fetchall()
+        return [
+            {'id': i, 'sheet_name': name, 'row': json.loads(row_json), 'created_at': created_at,
+             'attempts': attempts, 'last_error': last_error, 'sent_after_row': sent_after_row}
+            for i, name, row_json, created_at, attempts, last_error, sent_after_row in rows
+        ]
+
+    def last_error(self):
+        with self._lock:
+            return self._last_error
+
+    def _run(self):
+        while True:
+            try:
+                flushed_all = self._flush_pending()
+            except Exception as e:
+                # DB が読めないなど想定外のエラーでもスレッドは止めない
+                flushed_all = False
+                with self._lock:
+                    self._last_error = str(e)
+            if flushed_all:
+                self._failures = 0
+                wait_sec = IDLE_CHECK_SEC
+            else:
+                self._failures += 1
+                wait_sec = min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** (self._failures - 1))
+            self._wake.wait(wait_sec)
+            self._wake.clear()
+
+    def _flush_pending(self):
+        """登録済みのスプレッドシートについて未送信の行を送る。全て送れたら True"""
+        with self._lock:
+            books = dict(self._books)
+        ok = True
+        for spreadsheet_id, sh in books.items():
+            while True:
+                batch = self._next_batch(spreadsheet_id)
+                if not batch:
+                    break
+                name = batch[0]['sheet_name']
+                ids = [item['id'] for item in batch]
+                try:
+                    self._flush(sh, name, [item['row'] for item in batch], batch[0]['sent_after_row'])
+                except Exception as e:
+                    # 書き込まれていないことが確かな失敗（429 など）では、前回の送信の最終行を残しておく
+                    after_row = e.after_row if isinstance(e, PossiblyWritten) else None
+                    with closing(_connect()) as conn, conn:
+                        conn.executemany(
+                            "UPDATE pending SET attempts = attempts + 1, last_error = ?,"
+                            " sent_after_row = COALESCE(?, sent_after_row) WHERE id = ?",
+                            [(str(e), after_row, i) for i in ids],
+                        )
+                    with self._lock:
+                        self._last_error = str(e)
+                    ok = False
+                    break
+                with closing(_connect()) as conn, conn:
+                    conn.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+                with self._lock:
+                    self._last_error = None
+        return ok
+
+    def _next_batch(self, spreadsheet_id):
+        """
+        最も古い行と同じシートの行を、古い順に最大 FLUSH_BATCH_ROWS 行まとめて取り出す。
+        書き込まれたかもしれない行が残っている場合は、反映済みかを確認できるよう前回と同じ行だけを取り出す。
+        """
+        items = self.pending(spreadsheet_id)
+        if not items:
+            return []
+        name = items[0]['sheet_name']
+        sent_after_row = items[0]['sent_after_row']
+        return [
+            item for item in items
+            if item['sheet_name'] == name and item['sent_after_row'] == sent_after_row
+        ][:FLUSH_BATCH_ROWS]